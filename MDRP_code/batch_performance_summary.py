@@ -0,0 +1,121 @@
+from __future__ import print_function
+import os
+import re
+import sys
+import contextlib
+import concurrent.futures
+import pandas as pd
+from compute_performance_summary import compute_performance_summary,parse_console_option,parse_console_flag
+from stage_timer import StageTimer
+'''
+This script evaluates a whole set of solutions, one per instance, with compute_performance_summary.
+It takes as input:
+    1. instances directory: it contains one directory per instance (e.g. public_instances)
+    2. solutions directory: it contains one solution directory per instance, named after the
+       instance. Labels may list the instance characteristics in any order, so 1o50s2t100p125
+       and 1o50t100s2p125 refer to the same instance
+    3. output (summary) directory: per-instance outputs go to output_dir/<solution directory>;
+       if not provided, they are written in each solution directory
+    4. leaderboard file: one row per instance with its feasibility, total_delivered,
+       total_cost and proportion_trueup, written as CSV, or as Parquet if the name ends
+       with .parquet (which requires pyarrow)
+    5. workers: number of processes evaluating instances in parallel (defaults to the
+       number of CPUs)
+The options engine= and cache_instance= are passed on to compute_performance_summary. The
+leaderboard reports the time taken by each evaluation; with profile=yes, it also has a
+column with the time of each stage of the evaluation (see stage_timer.py).
+Per-instance files (feasibility_check.txt and solution_performance.txt) are the same as those
+produced by compute_performance_summary.py.
+Example call:
+    python batch_performance_summary.py instances_dir=public_instances solutions_dir=solutions/my_algorithm leaderboard=my_algorithm.csv workers=8
+'''
+
+leaderboard_columns=['instance','solution','feasible','total_delivered','total_orders',\
+                     'total_cost','proportion_trueup','evaluation_seconds','error']
+
+def instance_label_key(label):
+    # canonical form of an instance label: the seed followed by its characteristics
+    # (o/r size, s schedule, t travel speed, p preparation times) in a fixed order
+    match=re.match(r'^(\d+)((?:[a-z]\d+)+)$',label)
+    if not match:
+        return label
+    characteristics=re.findall(r'[a-z]\d+',match.group(2))
+    return match.group(1)+''.join(sorted(characteristics,key=lambda c:'orstp'.find(c[0])))
+
+def match_solutions_to_instances(instances_dir,solutions_dir):
+    # pairs (instance directory, solution directory) for every solution directory whose
+    # name matches an instance
+    instances={instance_label_key(i):os.path.join(instances_dir,i) for i in sorted(os.listdir(instances_dir))\
+               if os.path.isdir(os.path.join(instances_dir,i))}
+    pairs=[]
+    for s in sorted(os.listdir(solutions_dir)):
+        if not os.path.isdir(os.path.join(solutions_dir,s)):
+            continue
+        key=instance_label_key(s)
+        if key in instances:
+            pairs.append((instances[key],os.path.join(solutions_dir,s)))
+        else:
+            print('no instance found for solution directory',s)
+    return pairs
+
+def evaluate_solution(instance_dir,input_dir,output_dir,engine='vectorized',cache_instance=False,profile=False):
+    # runs in a worker process: evaluate one solution and return its leaderboard row (with
+    # the time taken by each stage of the evaluation if profile)
+    row={'instance':os.path.basename(instance_dir),'solution':os.path.basename(input_dir)}
+    timer=StageTimer()
+    try:
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        with open(os.devnull,'w') as devnull, contextlib.redirect_stdout(devnull):
+            feasible,total_delivered,total_cost,proportion_trueup,order_performance,courier_performance=\
+                compute_performance_summary(instance_dir,input_dir,output_dir,engine,cache_instance,timer=timer)
+        total_orders=len(pd.read_table(os.path.join(instance_dir,'orders.txt'),usecols=[0]))
+        row.update(feasible=feasible,total_delivered=total_delivered,total_orders=total_orders,\
+                   total_cost=total_cost,proportion_trueup=proportion_trueup,\
+                   evaluation_seconds=sum(seconds for _,seconds,_,_ in timer.stages))
+        if profile:
+            row.update(('seconds_'+stage,seconds) for stage,seconds,_,_ in timer.stages)
+    except Exception as e:
+        row['error']='{0}: {1}'.format(type(e).__name__,e)
+    return row
+
+def batch_performance_summary(instances_dir,solutions_dir,output_dir=None,leaderboard_file=None,\
+                              workers=None,engine='vectorized',cache_instance=False,profile=False):
+    pairs=match_solutions_to_instances(instances_dir,solutions_dir)
+    rows=[]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures=[executor.submit(evaluate_solution,instance_dir,input_dir,\
+                                 os.path.join(output_dir,os.path.basename(input_dir)) if output_dir else input_dir,\
+                                 engine,cache_instance,profile)\
+                 for instance_dir,input_dir in pairs]
+        for future in concurrent.futures.as_completed(futures):
+            row=future.result()
+            print(row['solution'],'error' if 'error' in row else\
+                  'feasible' if row['feasible'] else 'infeasible')
+            rows.append(row)
+    stage_columns=[c for row in rows for c in row if c.startswith('seconds_')]
+    columns=leaderboard_columns+sorted(set(stage_columns),key=stage_columns.index)
+    leaderboard=pd.DataFrame(rows,columns=columns).sort_values('solution').reset_index(drop=True)
+    if leaderboard_file:
+        if leaderboard_file.endswith('.parquet'):
+            leaderboard.to_parquet(leaderboard_file,index=False)
+        else:
+            leaderboard.to_csv(leaderboard_file,index=False)
+    return leaderboard
+
+if __name__=='__main__':
+    console_input=sys.argv
+    instances_dir=parse_console_option(console_input,'instances_dir',os.path.join(os.path.pardir,'public_instances'))
+    solutions_dir=parse_console_option(console_input,'solutions_dir',os.path.curdir)
+    output_dir=parse_console_option(console_input,'output_dir')
+    leaderboard_file=parse_console_option(console_input,'leaderboard',\
+                                          os.path.join(output_dir or solutions_dir,'leaderboard.csv'))
+    workers=parse_console_option(console_input,'workers')
+    engine=parse_console_option(console_input,'engine','vectorized')
+    cache_instance=parse_console_flag(console_input,'cache_instance')
+    profile=parse_console_flag(console_input,'profile')
+    print(instances_dir,solutions_dir,output_dir,leaderboard_file)
+    leaderboard=batch_performance_summary(instances_dir,solutions_dir,output_dir,leaderboard_file,\
+                                          int(workers) if workers else None,engine,cache_instance,profile)
+    print(leaderboard.to_string(index=False))
+    print('Leaderboard was written to file:',leaderboard_file)
@@ -0,0 +1,81 @@
+from __future__ import print_function
+import os
+import sys
+import pandas as pd
+from compute_performance_summary import parse_console_option,parse_console_flag
+from generate_instance import generate_instance
+from performance_evaluator import read_instance,read_solution,evaluate
+from stage_timer import StageTimer
+'''
+This script benchmarks the evaluator on instances of growing size, generated from a seed
+instance with generate_instance.py, to track how each stage scales (and catch regressions).
+It takes as input:
+    1. instance directory: the seed instance (defaults to the largest public instance)
+    2. factors: comma-separated scale factors of the generated instances (defaults to 1,2,5,10)
+    3. work directory: where the generated instances and their solutions are kept (each is
+       only generated once, in <work_dir>/<seed instance>x<factor>)
+    4. output file (optional): where the results are written, as CSV
+The options engine= and stream_solution= are those of compute_performance_summary.py; with
+memory=no, peak memory is not measured.
+For every size, each stage (instance read, solution read, location index, each feasibility
+check, metrics) is timed in one run, and its peak memory (as traced by tracemalloc) measured
+in another run. The results are printed as one table of seconds and one table of peak MB,
+with a row per stage and a column per number of orders.
+Example call:
+    python benchmark_evaluator.py instance_dir=../public_instances/7o100t100s1p125 factors=1,10,50 work_dir=benchmarks output=benchmark.csv
+'''
+
+def benchmark_stages(instance_dir,input_dir,engine='vectorized',stream_solution=False,trace_memory=False):
+    # (stage, seconds, rows, peak_bytes) of each stage of the evaluation of a solution
+    timer=StageTimer(trace_memory)
+    try:
+        instance=read_instance(instance_dir)
+        timer('instance_read',len(instance.orders))
+        solution=read_solution(input_dir,stream_solution)
+        timer('solution_read',len(solution.assignment_time) if stream_solution else len(solution[0]))
+        result=evaluate(instance,solution,engine,timer=timer)
+    finally:
+        timer.stop()
+    if not result.feasible:
+        print('warning: the solution in',input_dir,'is not feasible')
+    return timer.stages
+
+def benchmark_evaluator(seed_instance_dir,factors,work_dir,engine='vectorized',stream_solution=False,memory=True):
+    rows=[]
+    for factor in factors:
+        instance_dir=os.path.join(work_dir,'{0}x{1:g}'.format(os.path.basename(os.path.normpath(seed_instance_dir)),factor))
+        input_dir=os.path.join(instance_dir,'solution')
+        if not os.path.exists(os.path.join(input_dir,'solution_info_couriers.txt')):
+            print('generating',instance_dir)
+            generate_instance(seed_instance_dir,factor,instance_dir,input_dir)
+        orders=sum(1 for _ in open(os.path.join(instance_dir,'orders.txt')))-1
+        print('benchmarking',instance_dir,'({0} orders)'.format(orders))
+        stages=benchmark_stages(instance_dir,input_dir,engine,stream_solution)
+        peaks=benchmark_stages(instance_dir,input_dir,engine,stream_solution,True) if memory else stages
+        for (stage,seconds,stage_rows,_),(_,_,_,peak) in zip(stages,peaks):
+            rows.append({'factor':factor,'orders':orders,'stage':stage,'seconds':seconds,'rows':stage_rows,\
+                         'peak_mb':peak/2.0**20 if peak is not None else None})
+    return pd.DataFrame(rows,columns=['factor','orders','stage','seconds','rows','peak_mb'])
+
+if __name__=='__main__':
+    console_input=sys.argv
+    seed_instance_dir=parse_console_option(console_input,'instance_dir',\
+                                           os.path.join(os.path.pardir,'public_instances','7o100t100s1p125'))
+    factors=[float(f) for f in parse_console_option(console_input,'factors','1,2,5,10').split(',')]
+    work_dir=parse_console_option(console_input,'work_dir','benchmarks')
+    output_file=parse_console_option(console_input,'output')
+    engine=parse_console_option(console_input,'engine','vectorized')
+    stream_solution=parse_console_flag(console_input,'stream_solution')
+    memory=parse_console_flag(console_input,'memory',True)
+    results=benchmark_evaluator(seed_instance_dir,factors,work_dir,engine,stream_solution,memory)
+    stages=results.stage.unique()
+    print('\nseconds per stage')
+    print(results.pivot(index='stage',columns='orders',values='seconds').loc[stages]\
+                 .to_string(float_format=lambda x:'{0:.3f}'.format(x)))
+    if memory:
+        print('\npeak memory (MB) per stage')
+        print(results.pivot(index='stage',columns='orders',values='peak_mb').loc[stages]\
+                     .to_string(float_format=lambda x:'{0:.1f}'.format(x)))
+    if output_file:
+        results.to_csv(output_file,index=False)
+        print('Results were written to file:',output_file)
@@ -1,10 +1,12 @@
 from __future__ import print_function
 import pandas as pd
-pd.set_option('display.expand_frame_repr', False)
 import os
 import numpy as np
 import bisect
 import sys
+import json
+from performance_evaluator import read_instance,read_solution,evaluate
+from stage_timer import StageTimer,timing_table
 '''
 This script takes as input (at most) three directories, in the following order:
     1. instance directory: it is expected to contain files orders.txt, couriers.txt, restaurants.txt, and instance_parameters.txt
@@ -13,6 +15,21 @@ This script takes as input (at most) three directories, in the following order:
 The script produces two files, named 'feasibility_check.txt' and 'solution_performance.txt'.
 Example call:
     python compute_performance_summary.py instance_dir=instances/an_instance input_dir=solutions/my_instance/my_algorithm output_dir=performance_summaries/an_instance/my_algorithm
+Feasibility is checked with the columnar engine in vectorized_feasibility.py; the original
+row-by-row checks remain available (e.g. for cross-checking) by adding engine=rowwise.
+Adding cache_instance=yes reads the instance through the compiled cache of instance_cache.py
+(the directory instance_cache in the instance directory), which is faster when the same
+instance is evaluated many times. Adding stream_solution=yes reads the solution files in chunks straight
+into the compact arrays of solution_arrays.py, which needs much less memory on large solutions.
+Along with 'solution_performance.txt', the same summary is written unrounded in machine-readable
+form to 'solution_performance.json'; adding performance_frames=yes also writes the per-order and
+per-courier metrics to 'order_performance.parquet' and 'courier_performance.parquet' (which
+requires pyarrow).
+To evaluate solutions from Python without going through files, see performance_evaluator.py.
+Adding profile=yes (or --profile) profiles the evaluation: it prints the wall time, number of
+rows and peak memory of each stage (reading, each feasibility check, metrics, writing) and
+the functions taking the most time, and writes them to 'evaluator_timing.txt' and
+'evaluator_profile.prof' (cProfile statistics). Times are inflated by the profiler.
 '''
 
 # default directory
@@ -25,56 +42,53 @@ def traveltime(origin_id,destination_id,meters_per_minute,locations):
     tt=np.ceil(dist/meters_per_minute)
     return tt
 
+def parse_console_option(console_input,name,default=None):
+    # value of a name=value console argument, without surrounding quotes
+    option=next((p for p in console_input if name+'=' in p),None)
+    if not option:
+        return default
+    _,value=option.split('=',1)
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    elif value.startswith("'") and value.endswith("'"):
+        value = value[1:-1]
+    return value
+
+def parse_console_flag(console_input,name,default=False):
+    # value of a name=yes/no (true/false, 1/0) console argument
+    value=parse_console_option(console_input,name)
+    if value is None:
+        return default
+    return value.lower() in ('1','true','yes','y')
+
 def parse_console_input_and_define_parameter_values(console_input):
-    instance_dir=next((p for p in console_input if 'instance_dir=' in p),None)
-    if instance_dir:
-        # (containing orders.txt, couriers.txt, restaurants.txt and instance_parameters.txt)
-        _,instance_dir=instance_dir.split('=')
-        if instance_dir.startswith('"') and instance_dir.endswith('"'):
-            instance_dir = instance_dir[1:-1]
-        elif instance_dir.startswith("'") and instance_dir.endswith("'"):
-            instance_dir = instance_dir[1:-1]
-    else:
-        # if not provided, try the default instance directory
-        instance_dir=folder_default 
-
-    input_dir=next((p for p in console_input if 'input_dir=' in p),None)
-    if input_dir:
-        _,input_dir=input_dir.split('=')
-        if input_dir.startswith('"') and input_dir.endswith('"'):
-            input_dir = input_dir[1:-1]
-        elif input_dir.startswith("'") and input_dir.endswith("'"):
-            input_dir = input_dir[1:-1]
-    else:
-        input_dir=instance_dir
-
-    output_dir=next((p for p in console_input if 'output_dir=' in p),None)
-    if output_dir:
-        _,output_dir=output_dir.split('=')
-        if output_dir.startswith('"') and output_dir.endswith('"'):
-            output_dir = output_dir[1:-1]
-        elif output_dir.startswith("'") and output_dir.endswith("'"):
-            output_dir = output_dir[1:-1]
-    else:
-        output_dir=instance_dir
+    # (containing orders.txt, couriers.txt, restaurants.txt and instance_parameters.txt)
+    # if not provided, try the default instance directory
+    instance_dir=parse_console_option(console_input,'instance_dir',folder_default)
+    input_dir=parse_console_option(console_input,'input_dir',instance_dir)
+    output_dir=parse_console_option(console_input,'output_dir',instance_dir)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     return instance_dir,input_dir,output_dir
 
-def read_instance_information(instance_dir):
+def read_instance_tables(instance_dir):
     orders=pd.read_table(os.path.join(instance_dir,'orders.txt'))
     restaurants=pd.read_table(os.path.join(instance_dir,'restaurants.txt'))
     couriers=pd.read_table(os.path.join(instance_dir,'couriers.txt'))
     instanceparams=pd.read_table(os.path.join(instance_dir,'instance_parameters.txt'))
+    return orders,restaurants,couriers,instanceparams
 
-    order_locations=pd.DataFrame(data=[orders.order,orders.x,orders.y]).transpose()
-    order_locations.columns=['id','x','y']
-    restaurant_locations=pd.DataFrame(data=[restaurants.restaurant,restaurants.x,restaurants.y]).transpose()
-    restaurant_locations.columns=['id','x','y']
-    courier_locations=pd.DataFrame(data=[couriers.courier,couriers.x,couriers.y]).transpose()
-    courier_locations.columns=['id','x','y']
-    locations=pd.concat([order_locations,restaurant_locations,courier_locations])
-    locations.set_index('id',inplace=True)
+def read_instance_information(instance_dir):
+    return build_instance_information(*read_instance_tables(instance_dir))
+
+def build_instance_information(orders,restaurants,couriers,instanceparams):
+    # from the tables as read from the instance files
+    # locations of orders, restaurants and couriers in a single frame indexed by id (with
+    # object columns, as transposing each [id,x,y] frame would give) built column-wise
+    tables=[(orders,'order'),(restaurants,'restaurant'),(couriers,'courier')]
+    locations=pd.DataFrame({c:np.concatenate([t[c].to_numpy(dtype=object) for t,_ in tables]) for c in ['x','y']},\
+                           index=pd.Index(np.concatenate([t[i].to_numpy(dtype=object) for t,i in tables]),\
+                                          dtype=object,name='id'))
 
     orders.set_index('order',inplace=True)
     couriers.set_index('courier',inplace=True)
@@ -90,7 +104,7 @@ def read_instance_information(instance_dir):
            pickup_service_minutes,dropoff_service_minutes,target_click_to_door,\
            pay_per_order,guaranteed_pay_per_hour
 
-def read_solution_information(input_dir):
+def read_solution_information(input_dir,verbose=True):
     # read assignment solution file
     with open(os.path.join(input_dir,'solution_info_assignments.txt'),'r') as f:
         #raw_assignments=[a.replace(' ','\t').replace('\n','').split('\t') for a in f.readlines()]
@@ -121,10 +135,12 @@ def read_solution_information(input_dir):
         try:
             departure_time=int(float(line[1]))
         except:
-            print('detected header line:',header)
+            if verbose:
+                print('detected header line:',header)
             pass
         else: # if the line is not a header
             courier_id=line[0]
+            courier_moves=courier_sol.setdefault(courier_id,[])
             origin_id= line[2] if line[2]!='0' else courier_id
             destination_id=line[3].strip()
             courier_moves.append([departure_time,origin_id,destination_id])        
@@ -135,49 +151,86 @@ def read_solution_information(input_dir):
             else:
                 line=line.split()
                 if courier_id!=line[0]:
-                    courier_sol[courier_id]=courier_moves
-                    courier_moves=[]
+                    # the moves of a courier may come in several blocks (one per
+                    # assignment), interleaved with those of other couriers
                     courier_id=line[0]
+                    courier_moves=courier_sol.setdefault(courier_id,[])
                 departure_time=int(float(line[1]))
                 origin_id= line[2] if line[2]!='0' else courier_id
                 destination_id=line[3].strip()
                 courier_moves.append([departure_time,origin_id,destination_id])
-        if courier_id not in courier_sol:
-            courier_sol[courier_id]=courier_moves
-        courier_sol.pop(None, None)
     return assignment_sol,order_sol,courier_sol,order_pickup_times
 
-# Script
-def compute_performance_summary(instance_dir,input_dir,output_dir):
-    print('reading instance information')   
-    orders,restaurants,couriers,instanceparams,locations,meters_per_minute,\
-    pickup_service_minutes,dropoff_service_minutes,target_click_to_door,\
-    pay_per_order,guaranteed_pay_per_hour = read_instance_information(instance_dir)
-    print('reading solution information')
-    assignment_sol,order_sol,courier_sol,order_pickup_times = read_solution_information(input_dir)
-    
-    ### Check feasibility of solution
-    print('checking feasibility of the solution')
-    feasibility_file=os.path.join(output_dir,'feasibility_check.txt')
-    f= open(feasibility_file, "w")
+def index_assignments_by_order(assignment_sol):
+    # map each order to the (index labels of the) assignments whose bundle contains it,
+    # built in a single pass over the bundles; an order listed twice in the same bundle
+    # counts as a single assignment
+    assignments_per_order={}
+    for i,b in zip(assignment_sol.index,assignment_sol.bundle):
+        for o in b:
+            l=assignments_per_order.setdefault(o,[])
+            if not l or l[-1]!=i:
+                l.append(i)
+    return assignments_per_order
+
+def orders_in_several_assignments(assignment_sol,order_sol):
+    # orders (in order of first report) in more than one assignment; an order reported more
+    # than once in the order solution file counts once per line
+    assignments_per_order=index_assignments_by_order(assignment_sol)
+    times_reported=order_sol.index.value_counts()
+    return [o for o in order_sol.index.unique() if len(assignments_per_order.get(o,()))*times_reported[o]>1]
+
+# Feasibility checks: each check is identified by a key in the dictionary of violations
+# returned by the checking engines, and reported in feasibility_check.txt with the
+# corresponding messages (when violated, the violations are printed with the given separator)
+feasibility_checks=[
+    ('orders_in_several_assignments','orders in more than one assignment:',\
+     'every order is in at most one assignment: OK','\n'),
+    ('assignments_before_placement','\nassignments made before orders are placed:',\
+     '\nassignments are never made before information is revealed: OK','\n'),
+    ('pickups_after_off_time','\nbundle picked up after off-time of courier:',\
+     '\nbundle picked up before off-time of courier: OK','\n'),
+    ('pickups_before_ready_time','\nbundle pickup times do not respect individual ready times:',\
+     '\nbundle pickup times respect ready times: OK','\n'),
+    ('dropoffs_out_of_sequence','\ndropoffs do not follow the prescribed sequence:',\
+     '\ndropoffs follow the prescribed sequence:OK','\n'),
+    ('discontinuous_moves','\ndiscontinuities in sequence of origin-destination pairs:',\
+     '\ncontinuity in sequence of origin-destination pairs: OK','\n'),
+    ('departures_before_arrivals','\ndepartures sometimes happen before arrivals:',\
+     '\ndepartures and arrival time are consistent in time: OK','\n'),
+    ('dropoff_location_mismatches','\ninconsistency in dropoff times and locations',\
+     '\ndropoff times and locations are consistent:OK',' '),
+    ('pickup_location_mismatches','\ninconsistency in pickup times and locations',\
+     '\npickup times and locations are consistent:OK',' '),
+    ]
+
+def write_feasibility_check(violations,feasibility_file):
     feasible=True
+    with open(feasibility_file,'w') as f:
+        for key,violated_message,ok_message,sep in feasibility_checks:
+            if violations[key]:
+                print(violated_message,file=f)
+                print(*violations[key],sep=sep,file=f)
+                feasible=False
+            else:
+                print(ok_message,file=f)
+        print('FEASIBLE' if feasible else 'INFEASIBLE',file=f)
+    return feasible
+
+def check_feasibility_rowwise(orders,couriers,locations,meters_per_minute,\
+                              pickup_service_minutes,dropoff_service_minutes,\
+                              assignment_sol,order_sol,courier_sol,stage=None):
+    # row-by-row version of the feasibility checks, kept for cross-checking the
+    # vectorized engine (see vectorized_feasibility.py); besides the violations of each
+    # check, it returns the tallies per courier and bundle used by the performance metrics.
+    # stage: optional callback, called with the key of each check and the number of rows it
+    # checked once it is done
+    stage=stage or (lambda name,rows=None:None)
+    checks={}
 
     # verify that each order is in at most one assignment
-    bundles_per_order={}
-    for o in order_sol.index:
-        for b in assignment_sol.bundle:
-            if o in b:
-                if o in bundles_per_order:
-                    bundles_per_order[o].append(b)
-                else:
-                    bundles_per_order[o]=[b]
-    violations={o:l for o,l in bundles_per_order.items() if len(l)>1}
-    if violations: 
-        print('orders in more than one assignment:',file=f)
-        print(*violations.keys(),sep='\n',file=f)    
-        feasible=False
-    else:
-        print('every order is in at most one assignment: OK',file=f)
+    checks['orders_in_several_assignments']=orders_in_several_assignments(assignment_sol,order_sol)
+    stage('orders_in_several_assignments',len(order_sol))
 
     # verify that assignments are not made before information is revealed
     violations=[]
@@ -192,12 +245,8 @@ def compute_performance_summary(instance_dir,input_dir,output_dir):
             if assignment_time<placement:
                 violations.append((assignment_time,placement,o,a))
         orders_per_bundle.append(len(order_seq))
-    if violations:
-        print('\nassignments made before orders are placed:',file=f)
-        print(*violations,sep='\n',file=f)
-        feasible=False
-    else:
-        print('\nassignments are never made before information is revealed: OK',file=f)
+    checks['assignments_before_placement']=violations
+    stage('assignments_before_placement',sum(orders_per_bundle))
 
     # verify that each assignment is picked up before the off-time of the courier
     violations=[]
@@ -207,12 +256,8 @@ def compute_performance_summary(instance_dir,input_dir,output_dir):
         if offtime<a.pickup_time:
             violations.append((offtime,a.pickup_time,a))
         bundles_per_courier[a.courier]+=1
-    if violations:
-        print('\nbundle picked up after off-time of courier:',file=f)
-        print(*violations,sep='\n',file=f)
-        feasible=False
-    else:
-        print('\nbundle picked up before off-time of courier: OK',file=f)
+    checks['pickups_after_off_time']=violations
+    stage('pickups_after_off_time',len(assignment_sol))
 
     # verify that, for each assignment, the pickup time is not erlier than the ready time of any order in the bundle
     violations=[]
@@ -225,12 +270,8 @@ def compute_performance_summary(instance_dir,input_dir,output_dir):
             #print(ready,end=' ')
             if ready>pickup:
                 violations.append((pickup,ready,a))
-    if violations:
-        print('\nbundle pickup times do not respect individual ready times:',file=f)
-        print(*violations,sep='\n',file=f)
-        feasible=False    
-    else:
-        print('\nbundle pickup times respect ready times: OK',file=f)
+    checks['pickups_before_ready_time']=violations
+    stage('pickups_before_ready_time',sum(orders_per_bundle))
 
     # verify that dropoffs occur in the right order (one assignment after another one, 
     # respecting the delivery sequence in each assigned bundle) and that and delivery 
@@ -247,12 +288,8 @@ def compute_performance_summary(instance_dir,input_dir,output_dir):
                 if drop<dropoffs[-1]+dropoff_service_minutes:
                     violations.append((dropoffs,drop,order_seq))
             dropoffs.append(drop)
-    if violations:
-        print('\ndropoffs do not follow the prescribed sequence:',file=f)
-        print(*violations,sep='\n',file=f)
-        feasible=False
-    else:
-        print('\ndropoffs follow the prescribed sequence:OK',file=f)
+    checks['dropoffs_out_of_sequence']=violations
+    stage('dropoffs_out_of_sequence',sum(orders_per_bundle))
 
     # Prepare timeline for each courier: when are they in transit? when and where are
     # they not moving? While we're at it, verify that couriers do not tele-transport 
@@ -277,18 +314,10 @@ def compute_performance_summary(instance_dir,input_dir,output_dir):
             time_driving[d]+=tt
         if sorted(courier_timeline[d].times) != courier_timeline[d].times:#'if departures happen after arrivals, times are ordered'
             violations2.append(courier_timeline[d].times)
-    if violations1:
-        print('\ndiscontinuities in sequence of origin-destination pairs:',file=f)
-        print(*violations1,sep='\n',file=f)
-        feasible=False
-    else:
-        print('\ncontinuity in sequence of origin-destination pairs: OK',file=f)
-    if violations2:
-        print('\ndepartures sometimes happen before arrivals:',file=f)
-        print(*violations2,sep='\n',file=f)
-        feasible=False
-    else:
-        print('\ndepartures and arrival time are consistent in time: OK',file=f)
+    checks['discontinuous_moves']=violations1
+    stage('discontinuous_moves',sum(len(s) for s in courier_sol.values()))
+    checks['departures_before_arrivals']=violations2
+    stage('departures_before_arrivals',len(courier_sol))
 
     # Verify that for each dropoff, the courier is located at the right place at the right time
     time_dropping={d:0 for d in couriers.index} #leverage loop: couriers' total dropoff service time
@@ -308,12 +337,8 @@ def compute_performance_summary(instance_dir,input_dir,output_dir):
             violations.append((o_id,drop,loc_id))
         time_dropping[d]+=dropoff_service_minutes
         orders_served[d]+=1
-    if violations:
-        print('\ninconsistency in dropoff times and locations',file=f)
-        print(*violations,file=f)
-        feasible=False
-    else:
-        print('\ndropoff times and locations are consistent:OK',file=f)
+    checks['dropoff_location_mismatches']=violations
+    stage('dropoff_location_mismatches',len(order_sol))
 
     # Verify that, for each pickup, the courier is located at the right place at the right time
     time_picking={d:0 for d in couriers.index} #leverage loop: couriers' total pickup service time (lower bound)
@@ -326,104 +351,172 @@ def compute_performance_summary(instance_dir,input_dir,output_dir):
         i=bisect.bisect_left(courier_timeline[d].times,pickup)-1
         loc_id=courier_timeline[d].places[i]
         if loc_id!=r:
-            violations.append((o_id,r,pickup,loc_id))
+            violations.append((o,r,pickup,loc_id))
         time_picking[d]+=pickup_service_minutes
-    if violations:
-        print('\ninconsistency in pickup times and locations',file=f)
-        print(*violations,file=f)
-        feasible=False
-    else:
-        print('\npickup times and locations are consistent:OK',file=f)
+    checks['pickup_location_mismatches']=violations
+    stage('pickup_location_mismatches',len(assignment_sol))
 
-    # Verdict
-    if feasible:
-        print('FEASIBLE',file=f)
-        print('Solution is feasible.')
-    else:
-        print('INFEASIBLE',file=f)
-        print('Solution is not feasible. Check',feasibility_file, 'for more information')
-    f.close()
+    tallies={'orders_per_bundle':orders_per_bundle,'bundles_per_courier':bundles_per_courier,\
+             'orders_served':orders_served,'time_driving':time_driving,\
+             'time_dropping':time_dropping,'time_picking':time_picking}
+    return checks,tallies
+
+def courier_tally(tally,couriers):
+    # a per-courier tally (dict by courier id) aligned on the couriers frame: couriers
+    # missing from the tally get NaN
+    return pd.Series(tally,index=couriers.index)
+
+def compute_performance_metrics(orders,couriers,order_sol,tallies,target_click_to_door,\
+                                pay_per_order,guaranteed_pay_per_hour):
+    # order_sol: the order frame of read_solution_information; tallies: as returned by the
+    # feasibility checks. Every metric is computed column-wise
+    total_delivered=len(order_sol.dropna())
+    order_performance=pd.merge(orders.drop(['x','y','restaurant'],axis=1),\
+                               order_sol.drop(['placement_time','ready_time'],axis=1),\
+                               left_index=True,right_index=True)
+    order_performance['click-to-door']=order_performance['dropoff_time']-order_performance['placement_time']
+    order_performance['ready-to-door']=order_performance['dropoff_time']-order_performance['ready_time']
+    order_performance['ready-to-pickup']=order_performance['pickup_time']-order_performance['ready_time']
+    # (orders without a dropoff time have no overage)
+    overage=order_performance['click-to-door']-target_click_to_door
+    order_performance['click-to-door overage']=overage.where(overage>0,0)
+
+    courier_performance=couriers.drop(['x','y'],axis=1)
+    courier_performance['shift_duration']=courier_performance['off_time']-courier_performance['on_time']
+    courier_performance['guaranteed_earnings']=courier_performance['shift_duration']*guaranteed_pay_per_hour/60.0
+    courier_performance['orders_delivered']=courier_tally(tallies['orders_served'],couriers)
+    courier_performance['bundles_delivered']=courier_tally(tallies['bundles_per_courier'],couriers)
+    courier_performance['orders_per_hour']=60*courier_performance['orders_delivered']/courier_performance['shift_duration']
+    courier_performance['bundles_per_hour']=60*courier_performance['bundles_delivered']/courier_performance['shift_duration']
+    courier_performance['order_earnings']=courier_performance['orders_delivered']*pay_per_order
+    courier_performance['payment']=np.maximum(courier_performance['order_earnings'],courier_performance['guaranteed_earnings'])
+    courier_performance['time_driving']=courier_tally(tallies['time_driving'],couriers)
+    courier_performance['time_dropping']=courier_tally(tallies['time_dropping'],couriers)
+    courier_performance['time_picking']=courier_tally(tallies['time_picking'],couriers)
+    courier_performance['utilization']=(courier_performance['time_driving']+courier_performance['time_dropping']+\
+                                        courier_performance['time_picking'])/courier_performance['shift_duration']
+    courier_performance.fillna({'utilization':0},inplace=True)
+    total_cost=courier_performance['payment'].sum()
+    trueup=courier_performance['order_earnings'].to_numpy()<courier_performance['guaranteed_earnings'].to_numpy()
+    proportion_trueup=int(np.count_nonzero(trueup))/(1.0*len(couriers))
+    bundle_size=pd.DataFrame(tallies['orders_per_bundle'],columns=['orders_per_bundle'])
+    return total_delivered,total_cost,proportion_trueup,order_performance,courier_performance,bundle_size
+
+# columns of the per-order and per-courier frames summarized in solution_performance.txt
+order_performance_columns=['click-to-door','ready-to-door','ready-to-pickup','click-to-door overage']
+courier_performance_columns=['orders_per_hour','bundles_per_hour','utilization',\
+                             'guaranteed_earnings','order_earnings','payment']
+
+def write_performance_summary(performance_file,total_delivered,total_orders,total_cost,proportion_trueup,\
+                              order_performance,courier_performance,bundle_size):
+    with open(performance_file,'w') as f:
+        print('number of orders delivered:',total_delivered,'out of',total_orders,file=f)
+        print('total payment:','{0:.2f}'.format(total_cost),file=f)
+        print('proportion of couriers receiving minimum guaranteed compensation:',\
+               '{0:.2f}'.format(proportion_trueup),file=f)
+        print('\n',file=f)
+        print(order_performance[order_performance_columns]\
+                        .describe(percentiles=[0.1,0.9])\
+                        .to_string(float_format=lambda x:'{0:.2f}'.format(x)),file=f)
+        print('\n',file=f)
+        print(courier_performance[courier_performance_columns]\
+                                   .describe(percentiles=[0.1,0.9])\
+                                   .to_string(float_format=lambda x:'{0:.2f}'.format(x)),file=f)
+        print('\n',file=f)
+        print(bundle_size.describe(percentiles=[0.1,0.9])\
+                                   .to_string(float_format=lambda x:'{0:.2f}'.format(x)),file=f)
+
+def performance_statistics(frame):
+    # the describe() table of solution_performance.txt, as a dict by column of dicts by
+    # statistic (plain floats, None when missing)
+    statistics=frame.describe(percentiles=[0.1,0.9])
+    return {c:{k:None if pd.isna(v) else float(v) for k,v in statistics[c].items()} for c in statistics.columns}
+
+def performance_summary_data(total_delivered,total_orders,total_cost,proportion_trueup,\
+                             order_performance,courier_performance,bundle_size):
+    # the contents of solution_performance.txt, unrounded, as a dict that can be dumped to JSON
+    return {'total_delivered':int(total_delivered),'total_orders':int(total_orders),\
+            'total_cost':float(total_cost),'proportion_trueup':float(proportion_trueup),\
+            'orders':performance_statistics(order_performance[order_performance_columns]),\
+            'couriers':performance_statistics(courier_performance[courier_performance_columns]),\
+            'bundles':performance_statistics(bundle_size)}
+
+def write_performance_json(json_file,total_delivered,total_orders,total_cost,proportion_trueup,\
+                           order_performance,courier_performance,bundle_size):
+    with open(json_file,'w') as f:
+        json.dump(performance_summary_data(total_delivered,total_orders,total_cost,proportion_trueup,\
+                                           order_performance,courier_performance,bundle_size),f,indent=2)
+
+def write_performance_frames(output_dir,order_performance,courier_performance):
+    # the per-order and per-courier frames, as order_performance.parquet and
+    # courier_performance.parquet (which requires pyarrow)
+    order_performance.to_parquet(os.path.join(output_dir,'order_performance.parquet'))
+    courier_performance.to_parquet(os.path.join(output_dir,'courier_performance.parquet'))
+
+def write_profile(output_dir,profiler,stages):
+    # cProfile statistics of the evaluation (evaluator_profile.prof, which can be read with
+    # pstats or snakeviz) and the timing table of its stages (evaluator_timing.txt)
+    import pstats
+    profile_file=os.path.join(output_dir,'evaluator_profile.prof')
+    profiler.dump_stats(profile_file)
+    timing_file=os.path.join(output_dir,'evaluator_timing.txt')
+    with open(timing_file,'w') as f:
+        print(timing_table(stages),file=f)
+    print(timing_table(stages))
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    print('Profile and timing table were written to files:',profile_file,timing_file)
+
+# Script
+def compute_performance_summary(instance_dir,input_dir,output_dir,engine='vectorized',cache_instance=False,\
+                                stream_solution=False,performance_frames=False,timer=None):
+    # timer: optional StageTimer recording the stages of the evaluation (see stage_timer.py)
+    timer=timer or StageTimer()
+    print('reading instance information')   
+    instance=read_instance(instance_dir,cache_instance)
+    timer('instance_read',len(instance.orders))
+    print('reading solution information')
+    solution=read_solution(input_dir,stream_solution)
+    timer('solution_read',len(solution.assignment_time) if stream_solution else len(solution[0]))
     
-    ### Compute performance measures of solution
-    print('computing solution performance metrics')
-    try:
-        #print(order_sol.tail())
-        #print(order_sol.dropna().tail())
-        #print(len(order_sol))
-        #print(len(order_sol.dropna()))
-        total_delivered=len(order_sol.dropna())
-    except:
-        total_delivered=None
-    try:
-        order_performance=pd.merge(orders.drop(['x','y','restaurant'],axis=1),\
-                                   order_sol.drop(['placement_time','ready_time'],axis=1),\
-                                   left_index=True,right_index=True)
-        #order_performance['pickup_time']=order_pickup_times
-        order_performance['click-to-door']=order_performance['dropoff_time']-order_performance['placement_time']
-        order_performance['ready-to-door']=order_performance['dropoff_time']-order_performance['ready_time']
-        order_performance['ready-to-pickup']=order_performance['pickup_time']-order_performance['ready_time']
-        order_performance['click-to-door overage']=order_performance.apply(\
-                                                   lambda row:max(0,row['click-to-door']-target_click_to_door) ,axis=1)     
-    except:
-        order_performance=None
-    try:
-        courier_performance=couriers.drop(['x','y'],axis=1)
-        courier_performance['shift_duration']=courier_performance['off_time']-courier_performance['on_time']
-        courier_performance['guaranteed_earnings']=courier_performance['shift_duration']*guaranteed_pay_per_hour/60.0
-        courier_performance['orders_delivered']=pd.Series(orders_served)
-        courier_performance['bundles_delivered']=pd.Series(bundles_per_courier)
-        courier_performance['orders_per_hour']=60*courier_performance['orders_delivered']/courier_performance['shift_duration']
-        courier_performance['bundles_per_hour']=60*courier_performance['bundles_delivered']/courier_performance['shift_duration']
-        courier_performance['order_earnings']=courier_performance['orders_delivered']*pay_per_order
-        courier_performance['payment']=courier_performance.apply(lambda row: max(row['order_earnings'],row['guaranteed_earnings']),axis=1)
-        courier_performance['time_driving']=pd.Series(*zip(*[(v,k) for k,v in time_driving.items()]))
-        courier_performance['time_dropping']=pd.Series(*zip(*[(v,k) for k,v in time_dropping.items()]))
-        courier_performance['time_picking']=pd.Series(*zip(*[(v,k) for k,v in time_picking.items()]))
-        courier_performance['utilization']=(courier_performance['time_driving']+courier_performance['time_dropping']+\
-                                                 courier_performance['time_picking'])/courier_performance['shift_duration']
-        courier_performance.fillna({'utilization':0},inplace=True)
-        total_cost=courier_performance['payment'].sum()
-        proportion_trueup=len(courier_performance.loc[courier_performance['order_earnings']<courier_performance['guaranteed_earnings']])/(1.0*len(couriers))
-    except:
-        courier_performance=None
-        total_cost=None
-        proportion_trueup=None
-    try:
-        bundle_size=pd.DataFrame(orders_per_bundle,columns=['orders_per_bundle'])
-    except:
-        bundle_size=None
-    if feasible:
+    ### Check feasibility of solution and compute performance measures of solution
+    print('checking feasibility of the solution and computing solution performance metrics')
+    result=evaluate(instance,solution,engine,timer=timer)
+    feasibility_file=result.write_feasibility_check(output_dir)
+    if result.feasible:
+        print('Solution is feasible.')
         # write performance summary
-        performance_file=os.path.join(output_dir,'solution_performance.txt')        
-        with open(performance_file,'w') as f:
-            print('number of orders delivered:',total_delivered,'out of',len(orders),file=f)
-            print('total payment:','{0:.2f}'.format(total_cost),file=f)
-            print('proportion of couriers receiving minimum guaranteed compensation:',\
-                   '{0:.2f}'.format(proportion_trueup),file=f)
-            print('\n',file=f)
-            print(order_performance[['click-to-door','ready-to-door',\
-                            'ready-to-pickup','click-to-door overage']]\
-                            .describe(percentiles=[0.1,0.9])\
-                            .to_string(float_format=lambda x:'{0:.2f}'.format(x)),file=f)
-            print('\n',file=f)
-            print(courier_performance[['orders_per_hour','bundles_per_hour','utilization',\
-                                       'guaranteed_earnings','order_earnings','payment']]\
-                                       .describe(percentiles=[0.1,0.9])\
-                                       .to_string(float_format=lambda x:'{0:.2f}'.format(x)),file=f)
-            print('\n',file=f)
-            print(bundle_size.describe(percentiles=[0.1,0.9])\
-                                       .to_string(float_format=lambda x:'{0:.2f}'.format(x)),file=f)
+        performance_file=result.write_performance_summary(output_dir)
         print('Performance measures were written to file:',performance_file)
+        if performance_frames:
+            result.write_performance_frames(output_dir)
+            print('Per-order and per-courier performance were written to:',output_dir)
     else:
-        pass    
-    return feasible,total_delivered,total_cost,proportion_trueup,order_performance,courier_performance
+        print('Solution is not feasible. Check',feasibility_file, 'for more information')
+    timer('write')
+    return result.as_tuple()
 
 if __name__=='__main__':
+    pd.set_option('display.expand_frame_repr', False)
     console_input=sys.argv
     #console_input=['instance_dir=8o100t75s2p125',r'input_dir=8o100t75s2p125\results\p_31','output_dir=.']
     #console_input=['instance_dir=3o50t75s1p125']
     print(console_input)
     print(pd.__version__)
     instance_dir,input_dir,output_dir = parse_console_input_and_define_parameter_values(console_input)
+    engine=parse_console_option(console_input,'engine','vectorized')
+    cache_instance=parse_console_flag(console_input,'cache_instance')
+    stream_solution=parse_console_flag(console_input,'stream_solution')
+    performance_frames=parse_console_flag(console_input,'performance_frames')
+    profile=parse_console_flag(console_input,'profile') or '--profile' in console_input
     print(instance_dir,input_dir,output_dir)
-    feasible,total_delivered,total_cost,proportion_trueup,order_performance,courier_performance=compute_performance_summary(instance_dir,input_dir,output_dir)
\ No newline at end of file
+    timer=StageTimer(trace_memory=profile)
+    if profile:
+        import cProfile
+        profiler=cProfile.Profile()
+        profiler.enable()
+    feasible,total_delivered,total_cost,proportion_trueup,order_performance,courier_performance=compute_performance_summary(\
+        instance_dir,input_dir,output_dir,engine,cache_instance,stream_solution,performance_frames,timer)
+    if profile:
+        profiler.disable()
+        timer.stop()
+        write_profile(output_dir,profiler,timer.stages)
\ No newline at end of file
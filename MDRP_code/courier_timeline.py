@@ -0,0 +1,88 @@
+from __future__ import print_function
+import bisect
+import numpy as np
+'''
+Courier timelines in compressed (CSR-like) form. The timeline of a courier is the sequence
+of times [on time, departure, arrival, departure, arrival, ...] and the places where the
+courier stays from each of those times on: its on-location, nowhere while in transit, then
+each destination. The timelines of all couriers are concatenated into one times array and
+one places array, with per-courier offsets, and the place of many couriers at many times is
+found with a single np.searchsorted over all the events.
+'''
+
+class CourierTimelines(object):
+    def __init__(self,couriers,offsets,times,places,is_sorted,n_codes):
+        # couriers: courier codes (see solution_arrays.py), one per timeline
+        # offsets: timeline c spans times[offsets[c]:offsets[c+1]] (and places)
+        # times, places: concatenated timelines; the place of couriers in transit is -1
+        # is_sorted: whether each timeline is sorted, i.e. departures never happen before
+        #     the previous arrival
+        # n_codes: number of codes, to map courier codes to timelines
+        self.couriers=couriers
+        self.offsets=offsets
+        self.times=times
+        self.places=places
+        self.is_sorted=is_sorted
+        self.timeline_of_code=np.full(n_codes,-1,dtype=np.int64)
+        self.timeline_of_code[couriers]=np.arange(len(couriers))
+
+    @classmethod
+    def from_moves(cls,couriers,on_time,move_offsets,departures,arrivals,destinations,n_codes):
+        # couriers, move_offsets, destinations: as in SolutionArrays; on_time, departures and
+        # arrivals: the on time of each courier and the departure and arrival time of each move
+        moves_per_courier=np.diff(move_offsets)
+        offsets=np.zeros(len(couriers)+1,dtype=np.int64)
+        np.cumsum(1+2*moves_per_courier,out=offsets[1:])
+        move_courier=np.repeat(np.arange(len(couriers)),moves_per_courier)
+        departure_entry=offsets[move_courier]+1+2*(np.arange(len(departures))-move_offsets[move_courier])
+        times=np.empty(offsets[-1],dtype=np.float64)
+        places=np.full(offsets[-1],-1,dtype=np.int64)
+        times[offsets[:-1]]=on_time
+        places[offsets[:-1]]=couriers
+        times[departure_entry]=departures
+        times[departure_entry+1]=arrivals
+        places[departure_entry+1]=destinations
+        # a timeline is sorted unless some time is smaller than the previous one (of the same courier)
+        decrease=np.flatnonzero(np.diff(times)<0)+1
+        decrease=decrease[~np.isin(decrease,offsets)]
+        is_sorted=np.ones(len(couriers),dtype=bool)
+        is_sorted[np.searchsorted(offsets,decrease,side='right')-1]=False
+        return cls(couriers,offsets,times,places,is_sorted,n_codes)
+
+    def timeline(self,courier):
+        # times and places of the timeline of a courier (code)
+        c=self.timeline_of_code[courier]
+        return self.times[self.offsets[c]:self.offsets[c+1]],self.places[self.offsets[c]:self.offsets[c+1]]
+
+    def timelines_of(self,couriers):
+        # timeline of each courier code; couriers without one raise a KeyError
+        timelines=self.timeline_of_code[couriers]
+        if (timelines<0).any():
+            raise KeyError(couriers[timelines<0][0])
+        return timelines
+
+    def locate(self,event_couriers,event_times):
+        # place of each courier (code) at the time of each event: the place reached at the
+        # latest timeline entry strictly before the event time, as bisect.bisect_left(times,
+        # event time)-1 finds it (so the last place if there is none). Times are replaced by
+        # their exact ranks among all times, so that (timeline, rank) pairs can be encoded in
+        # a single sorted integer array, searched for all events at once. Unsorted timelines
+        # (an infeasibility reported elsewhere) are bisected event by event instead
+        event_couriers=np.asarray(event_couriers)
+        event_times=np.asarray(event_times,dtype=np.float64)
+        timelines=self.timelines_of(event_couriers)
+        start=self.offsets[timelines]
+        end=self.offsets[timelines+1]
+        known=~np.isnan(event_times)
+        values=np.unique(np.concatenate([self.times,event_times[known]]))
+        stride=len(values)+1
+        entry_timeline=np.repeat(np.arange(len(self.couriers)),np.diff(self.offsets))
+        keys=np.sort(entry_timeline*stride+np.searchsorted(values,self.times))
+        event_keys=timelines*stride+np.searchsorted(values,np.where(known,event_times,0))
+        entry=np.searchsorted(keys,event_keys,side='left')-1
+        entry=np.where(known&(entry>=start),entry,end-1)
+        for k in np.flatnonzero(~self.is_sorted[timelines]):
+            times=self.times[start[k]:end[k]].tolist()
+            i=bisect.bisect_left(times,event_times[k])-1
+            entry[k]=start[k]+i if i>=0 else end[k]-1
+        return self.places[entry]
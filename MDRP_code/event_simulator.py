@@ -0,0 +1,244 @@
+from __future__ import print_function
+import sys
+import math
+import time
+import heapq
+import importlib
+from compute_performance_summary import read_instance_tables,parse_console_option
+from generate_instance import write_solution
+'''
+This script replays an instance as a discrete-event simulation, in which a dispatching policy
+is called every interval minutes to assign the orders revealed so far, and writes the
+resulting solution in the format read by compute_performance_summary.py. It takes as input:
+    1. instance directory: it is expected to contain files orders.txt, couriers.txt, restaurants.txt, and instance_parameters.txt
+    2. output (solution) directory (optional): where the solution files are written
+    3. policy: 'greedy' (the policy of greedy_dispatcher.py, the default) or module.name of
+       any policy (see below)
+    4. interval: minutes between two calls of the policy (defaults to 5)
+    5. replays: number of times the instance is simulated, to time the simulation (defaults to 1)
+The option max_bundle= is passed on to the greedy policy. With stream=<file>, the records of
+the solution (see online_evaluator.py) are also written to a file as each assignment is
+committed, one line each, for online_evaluator.py to follow while the simulation runs.
+Events (courier on and off times, order placements and ready times, dropoffs, decisions) are
+kept in a heap, and processed in time order; at the same minute, decisions come last, so the
+policy sees every order placed by then. The arrival and pickup times of an assignment are
+fixed when it is committed, so only its dropoffs (after which the courier may be idle) are
+events. A policy is a callable policy(simulator, t) that returns the assignments to commit
+at time t, as (courier position, [order positions in dropoff sequence]) pairs, all orders of
+the same restaurant and placed by t. The policy reads the state of the simulation from the
+simulator: the instance as lists indexed by position (order_x, ready, restaurant, courier_x,
+off_time, ...), the orders placed but not assigned (pending, and among them the ready ones),
+the couriers on shift and idle (idle), those carrying out an assignment (busy), the couriers
+by on time (couriers_by_on_time, with their on_times_sorted), and where and when each courier
+is free of the assignments committed so far (courier_x, courier_y, place and free).
+A committed assignment is carried out as in greedy_dispatcher.py: the courier leaves when it
+is free (not before t), waits the service time at the restaurant and at each customer, and
+leaves at the pickup and each dropoff time.
+Example call:
+    python event_simulator.py instance_dir=../public_instances/7o100t100s1p125 output_dir=solutions/simulated/7o100t100s1p125 replays=10
+'''
+
+# events at the same minute are processed in this order
+event_priority={'courier_on':0,'order_placed':1,'order_ready':2,'dropoff':3,'courier_off':4,'decision':5}
+
+class Simulator(object):
+    def __init__(self,orders,restaurants,couriers,instanceparams,policy,interval=5,record=None):
+        # orders, restaurants, couriers, instanceparams: the tables as read from the
+        # instance files
+        # record: optional callback, called with the kind and fields of each row of the
+        # solution files as it is committed (see OnlineEvaluator.record)
+        self.policy=policy
+        self.interval=interval
+        self.record=record
+        self.meters_per_minute=float(instanceparams.at[0,'meters_per_minute'])
+        self.pickup_service_minutes=max(int(instanceparams.at[0,'pickup service minutes']),1)
+        self.dropoff_service_minutes=max(int(instanceparams.at[0,'dropoff service minutes']),1)
+
+        self.order_ids=orders.order.tolist()
+        self.order_x=orders.x.astype(float).tolist()
+        self.order_y=orders.y.astype(float).tolist()
+        self.placement=orders.placement_time.astype(int).tolist()
+        self.ready=orders.ready_time.astype(int).tolist()
+        self.restaurant_ids=restaurants.restaurant.tolist()
+        restaurant_position={r:i for i,r in enumerate(self.restaurant_ids)}
+        self.restaurant=[restaurant_position[r] for r in orders.restaurant]
+        self.restaurant_x=restaurants.x.astype(float).tolist()
+        self.restaurant_y=restaurants.y.astype(float).tolist()
+        self.courier_ids=couriers.courier.tolist()
+        self.initial_x=couriers.x.astype(float).tolist()
+        self.initial_y=couriers.y.astype(float).tolist()
+        self.on_time=couriers.on_time.astype(int).tolist()
+        self.off_time=couriers.off_time.astype(int).tolist()
+        self.couriers_by_on_time=sorted(range(len(self.courier_ids)),key=lambda d:(self.on_time[d],d))
+        self.on_times_sorted=[self.on_time[d] for d in self.couriers_by_on_time]
+        self.reset()
+
+    def travel(self,x0,y0,x1,y1):
+        # same as traveltime() in compute_performance_summary.py
+        return int(math.ceil(math.sqrt((x1-x0)**2+(y1-y0)**2)/self.meters_per_minute))
+
+    def reset(self):
+        self.now=None
+        self.courier_x=list(self.initial_x) # where each courier is free (after its last assignment)
+        self.courier_y=list(self.initial_y)
+        self.free=list(self.on_time) # time from which each courier can leave that place
+        self.place=['0']*len(self.courier_ids) # that place ('0': the on-location of the courier)
+        self.pending=set() # orders placed and not assigned
+        self.ready_orders=set() # pending orders that are ready
+        self.idle=set() # couriers on shift with nothing to do
+        self.busy=set() # couriers carrying out an assignment (until their last dropoff)
+        self.unplaced=len(self.order_ids)
+        self.delivered=0
+        self.decision_seconds=[] # wall time of each call of the policy
+        self.assignments=[]
+        self.order_rows=[]
+        self.moves=[[] for _ in self.courier_ids]
+        self.events=[]
+        self.sequence=0
+        for d,(on,off) in enumerate(zip(self.on_time,self.off_time)):
+            self.events.append((on,event_priority['courier_on'],d,'courier_on',d))
+            self.events.append((off,event_priority['courier_off'],d,'courier_off',d))
+        for o,(placed,ready) in enumerate(zip(self.placement,self.ready)):
+            self.events.append((placed,event_priority['order_placed'],o,'order_placed',o))
+            self.events.append((ready,event_priority['order_ready'],o,'order_ready',o))
+        heapq.heapify(self.events)
+        self.last_decision=max(self.off_time) if self.off_time else 0
+        if self.placement:
+            self.push((min(self.placement)//self.interval)*self.interval,'decision',None)
+
+    def push(self,t,kind,data):
+        # events pushed while simulating come after those of the instance at the same minute
+        # and priority, in the order they are pushed
+        self.sequence+=1
+        heapq.heappush(self.events,(t,event_priority[kind],len(self.order_ids)+len(self.courier_ids)+self.sequence,kind,data))
+
+    def run(self):
+        # simulate until there are no events left; returns the solution as lists of
+        # assignment rows, order rows and courier moves, as write_solution expects
+        events=self.events
+        while events:
+            t,_,_,kind,data=heapq.heappop(events)
+            self.now=t
+            if kind=='order_placed':
+                self.pending.add(data)
+                self.unplaced-=1
+                if self.ready[data]<=t:
+                    self.ready_orders.add(data)
+            elif kind=='order_ready':
+                if data in self.pending:
+                    self.ready_orders.add(data)
+            elif kind=='courier_on':
+                if self.free[data]<=t:
+                    self.idle.add(data)
+            elif kind=='courier_off':
+                self.idle.discard(data)
+            elif kind=='dropoff':
+                d,o=data
+                self.delivered+=1
+                if self.free[d]==t:
+                    self.busy.discard(d)
+                    if t<self.off_time[d]:
+                        self.idle.add(d)
+            elif kind=='decision':
+                self.decide(t)
+        courier_moves=[(self.courier_ids[d],)+m for d in range(len(self.courier_ids)) for m in self.moves[d]]
+        return self.assignments,self.order_rows,courier_moves
+
+    def decide(self,t):
+        start=time.perf_counter()
+        decisions=self.policy(self,t)
+        self.decision_seconds.append(time.perf_counter()-start)
+        for d,bundle in decisions:
+            self.assign(t,d,bundle)
+        if t+self.interval<=self.last_decision and (self.pending or self.unplaced):
+            self.push(t+self.interval,'decision',None)
+
+    def assign(self,t,d,bundle):
+        # carry out an assignment committed at time t
+        if not bundle or any(o not in self.pending for o in bundle):
+            raise ValueError('assignment of orders not pending at time {0}: {1}'.format(t,[self.order_ids[o] for o in bundle]))
+        r=self.restaurant[bundle[0]]
+        if any(self.restaurant[o]!=r for o in bundle):
+            raise ValueError('bundle of orders from several restaurants: {0}'.format([self.order_ids[o] for o in bundle]))
+        rx,ry=self.restaurant_x[r],self.restaurant_y[r]
+        departure=max(self.free[d],t)
+        arrival=departure+self.travel(self.courier_x[d],self.courier_y[d],rx,ry)
+        pickup=max(max(self.ready[o] for o in bundle),arrival+self.pickup_service_minutes)
+        if pickup>self.off_time[d]:
+            raise ValueError('pickup at {0} after the off time of courier {1}'.format(pickup,self.courier_ids[d]))
+        self.idle.discard(d)
+        self.busy.add(d)
+        self.moves[d].append((departure,self.place[d],self.restaurant_ids[r]))
+        x,y,origin,leave=rx,ry,self.restaurant_ids[r],pickup
+        for o in bundle:
+            dropoff=leave+self.travel(x,y,self.order_x[o],self.order_y[o])+self.dropoff_service_minutes
+            self.moves[d].append((leave,origin,self.order_ids[o]))
+            self.order_rows.append((self.order_ids[o],self.placement[o],self.ready[o],pickup,dropoff,self.courier_ids[d]))
+            self.push(dropoff,'dropoff',(d,o))
+            x,y,origin,leave=self.order_x[o],self.order_y[o],self.order_ids[o],dropoff
+            self.pending.discard(o)
+            self.ready_orders.discard(o)
+        self.assignments.append((t,pickup,self.courier_ids[d],[self.order_ids[o] for o in bundle]))
+        self.free[d]=leave
+        self.courier_x[d],self.courier_y[d]=x,y
+        self.place[d]=origin
+        if self.record:
+            self.record('assignment',self.assignments[-1])
+            for m in self.moves[d][-len(bundle)-1:]:
+                self.record('move',(self.courier_ids[d],)+m)
+            for row in self.order_rows[-len(bundle):]:
+                self.record('order',row)
+
+def simulate(orders,restaurants,couriers,instanceparams,policy,interval=5,record=None):
+    # the solution of a policy (see Simulator.run)
+    return Simulator(orders,restaurants,couriers,instanceparams,policy,interval,record).run()
+
+def load_policy(name,max_bundle=2):
+    # 'greedy' or module.name of a policy
+    if name=='greedy':
+        from greedy_dispatcher import GreedyPolicy
+        return GreedyPolicy(max_bundle)
+    module,_,attribute=name.rpartition('.')
+    return getattr(importlib.import_module(module),attribute)
+
+if __name__=='__main__':
+    console_input=sys.argv
+    instance_dir=parse_console_option(console_input,'instance_dir')
+    output_dir=parse_console_option(console_input,'output_dir')
+    policy_name=parse_console_option(console_input,'policy','greedy')
+    interval=int(parse_console_option(console_input,'interval','5'))
+    replays=int(parse_console_option(console_input,'replays','1'))
+    max_bundle=int(parse_console_option(console_input,'max_bundle','2'))
+    stream_file=parse_console_option(console_input,'stream')
+    print(instance_dir,output_dir,policy_name,interval)
+    orders,restaurants,couriers,instanceparams=read_instance_tables(instance_dir)
+    policy=load_policy(policy_name,max_bundle)
+    record=None
+    if stream_file:
+        from online_evaluator import format_record
+        stream=open(stream_file,'w',buffering=1) # line buffered, so readers see whole lines
+        record=lambda kind,fields:stream.write(format_record(kind,fields)+'\n')
+    simulator=Simulator(orders,restaurants,couriers,instanceparams,policy,interval,record)
+    seconds=[]
+    for replay in range(replays):
+        start=time.perf_counter()
+        if replay>0:
+            simulator.reset()
+        solution=simulator.run()
+        seconds.append(time.perf_counter()-start)
+        if stream_file:
+            simulator.record=None # only the first replay is streamed
+    policy_seconds=sum(simulator.decision_seconds)
+    click_to_door=[dropoff-placement for _,placement,_,_,dropoff,_ in simulator.order_rows]
+    print('orders delivered: {0} out of {1}'.format(simulator.delivered,len(simulator.order_ids)))
+    print('mean click-to-door: {0:.2f}'.format(sum(click_to_door)/float(max(len(click_to_door),1))))
+    print('seconds per replay: {0:.4f} (best of {1}: {2:.4f})'.format(sum(seconds)/len(seconds),replays,min(seconds)))
+    print('policy calls: {0}, seconds per call: {1:.5f} (max {2:.5f}), share of the replay: {3:.1%}'\
+          .format(len(simulator.decision_seconds),policy_seconds/max(len(simulator.decision_seconds),1),\
+                  max(simulator.decision_seconds or [0]),policy_seconds/seconds[-1]))
+    if stream_file:
+        stream.write('end\n')
+        stream.close()
+    if output_dir:
+        write_solution(output_dir,*solution)
+        print('Solution was written to directory:',output_dir)
@@ -0,0 +1,167 @@
+from __future__ import print_function
+import os
+import sys
+import math
+import numpy as np
+import pandas as pd
+from compute_performance_summary import read_instance_tables,parse_console_option
+from location_index import batch_traveltime
+'''
+This script generates a synthetic instance by scaling a seed instance up (or down), and a
+feasible solution of the generated instance, for benchmarking the evaluator at sizes beyond
+those of public_instances. It takes as input:
+    1. instance directory: the seed instance (e.g. public_instances/7o100t100s1p125)
+    2. factor: the scale of the generated instance; the seed is copied int(factor) times, and
+       a random fraction of its orders and couriers is added for the fractional part of the
+       factor (which alone, below 1, samples the order set as the o50 instances do)
+    3. output directory: where orders.txt, restaurants.txt, couriers.txt and
+       instance_parameters.txt are written
+    4. solution directory (optional): where a feasible solution is written, in the format of
+       solution_info_assignments.txt, solution_info_orders.txt and solution_info_couriers.txt
+    5. jitter: standard deviation (in meters) of the noise added to the coordinates of the
+       restaurants, orders and couriers of each copy but the first (defaults to 100)
+    6. seed: random seed (defaults to 0)
+Each copy has its own restaurants, orders and couriers (renumbered r1, r2, ..., o1, o2, ...,
+c1, c2, ...), with the times of the seed, so the generated instance is as many times denser
+over the same area and day. The solution is built greedily, copy by copy: orders are taken
+by ready time (consecutive orders of the same restaurant in a bundle of two) and assigned to
+the courier of the copy that can pick them up first; orders that no courier can pick up
+before its off time are left undelivered.
+Example call:
+    python generate_instance.py instance_dir=../public_instances/7o100t100s1p125 factor=10 output_dir=large/7x10 solution_dir=large/7x10/greedy
+'''
+
+def scale_instance(orders,restaurants,couriers,factor,jitter=100,seed=0):
+    # orders, restaurants, couriers: the tables as read from the instance files. Returns the
+    # scaled tables, and the copy of each order and courier
+    rng=np.random.RandomState(seed)
+    tables={'orders':[],'restaurants':[],'couriers':[]}
+    order_copy=[]
+    courier_copy=[]
+    for copy in range(int(math.ceil(factor))):
+        fraction=min(1.0,factor-copy)
+        copy_orders=orders.copy()
+        copy_couriers=couriers.copy()
+        if fraction<1:
+            copy_orders=copy_orders.loc[np.sort(rng.choice(len(orders),int(round(fraction*len(orders))),replace=False))]
+            copy_couriers=copy_couriers.loc[np.sort(rng.choice(len(couriers),int(round(fraction*len(couriers))),replace=False))]
+        # restaurants of the copy are numbered after those of previous copies
+        copy_restaurants=restaurants.copy()
+        renumber=dict(zip(restaurants.restaurant,['r{0}'.format(copy*len(restaurants)+i+1) for i in range(len(restaurants))]))
+        copy_restaurants['restaurant']=copy_restaurants.restaurant.map(renumber)
+        copy_orders['restaurant']=copy_orders.restaurant.map(renumber)
+        for name,table in [('orders',copy_orders),('restaurants',copy_restaurants),('couriers',copy_couriers)]:
+            if copy>0 and jitter:
+                table['x']=table.x+np.rint(rng.normal(0,jitter,len(table))).astype(table.x.dtype)
+                table['y']=table.y+np.rint(rng.normal(0,jitter,len(table))).astype(table.y.dtype)
+            tables[name].append(table)
+        order_copy.append(np.full(len(copy_orders),copy))
+        courier_copy.append(np.full(len(copy_couriers),copy))
+    orders,restaurants,couriers=[pd.concat(tables[name],ignore_index=True) for name in ['orders','restaurants','couriers']]
+    orders['order']=['o{0}'.format(i+1) for i in range(len(orders))]
+    couriers['courier']=['c{0}'.format(i+1) for i in range(len(couriers))]
+    return orders,restaurants,couriers,np.concatenate(order_copy),np.concatenate(courier_copy)
+
+def write_instance(output_dir,orders,restaurants,couriers,instanceparams):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    for file_name,table in [('orders.txt',orders),('restaurants.txt',restaurants),\
+                            ('couriers.txt',couriers),('instance_parameters.txt',instanceparams)]:
+        table.to_csv(os.path.join(output_dir,file_name),sep='\t',index=False)
+
+def build_feasible_solution(orders,restaurants,couriers,instanceparams,order_copy,courier_copy):
+    # greedy feasible solution (see above), as lists of assignment rows (assignment_time,
+    # pickup_time, courier, orders), order rows (order, placement_time, ready_time,
+    # pickup_time, dropoff_time, courier) and courier moves (courier, departure_time, origin,
+    # destination), each courier's moves in sequence
+    meters_per_minute=instanceparams.at[0,'meters_per_minute']
+    pickup_service_minutes=instanceparams.at[0,'pickup service minutes']
+    dropoff_service_minutes=instanceparams.at[0,'dropoff service minutes']
+    restaurant_xy=dict(zip(restaurants.restaurant,zip(restaurants.x.tolist(),restaurants.y.tolist())))
+    travel=lambda a,b:int(batch_traveltime(a[0],a[1],b[0],b[1],meters_per_minute))
+    assignments=[]
+    order_rows=[]
+    moves={d:[] for d in couriers.courier}
+    for copy in np.unique(order_copy):
+        c=couriers[courier_copy==copy]
+        courier_ids=c.courier.tolist()
+        x=c.x.to_numpy(dtype=np.float64)
+        y=c.y.to_numpy(dtype=np.float64)
+        free=c.on_time.to_numpy(dtype=np.float64)
+        off=c.off_time.to_numpy(dtype=np.float64)
+        place=['0']*len(c) # origin of the next move ('0': the on-location of the courier)
+        pending=orders[order_copy==copy].sort_values('ready_time',kind='stable')
+        pending=list(zip(pending.order,pending.x,pending.y,pending.placement_time,pending.restaurant,pending.ready_time))
+        i=0
+        while i<len(pending):
+            bundle=pending[i:i+2] if i+1<len(pending) and pending[i+1][4]==pending[i][4] else pending[i:i+1]
+            i+=len(bundle)
+            r=bundle[0][4]
+            rx,ry=restaurant_xy[r]
+            assignment_time=max(o[3] for o in bundle)
+            departure=np.maximum(free,assignment_time)
+            arrival=departure+batch_traveltime(x,y,rx,ry,meters_per_minute)
+            # the courier must have arrived strictly before the pickup time
+            pickup=np.maximum(max(o[5] for o in bundle),arrival+max(pickup_service_minutes,1))
+            pickup=np.where(pickup<=off,pickup,np.inf)
+            k=int(np.argmin(pickup))
+            if np.isinf(pickup[k]):
+                continue # no courier can pick up the bundle: left undelivered
+            d=courier_ids[k]
+            moves[d].append((int(departure[k]),place[k],r))
+            t=int(pickup[k])
+            location=(rx,ry)
+            place_id=r
+            for o,ox,oy,placement_time,_,ready_time in bundle:
+                # depart at t, drop off one minute after arriving, leave after the service time
+                dropoff=t+travel(location,(ox,oy))+1
+                moves[d].append((t,place_id,o))
+                order_rows.append((o,placement_time,ready_time,int(pickup[k]),dropoff,d))
+                t=dropoff+max(dropoff_service_minutes,1)
+                location=(ox,oy)
+                place_id=o
+            assignments.append((int(assignment_time),int(pickup[k]),d,[o[0] for o in bundle]))
+            free[k]=t
+            x[k],y[k]=location
+            place[k]=place_id
+    courier_moves=[(d,)+m for d in couriers.courier for m in moves[d]]
+    return assignments,order_rows,courier_moves
+
+def write_solution(solution_dir,assignments,order_rows,courier_moves):
+    if not os.path.exists(solution_dir):
+        os.makedirs(solution_dir)
+    with open(os.path.join(solution_dir,'solution_info_assignments.txt'),'w') as f:
+        print('assignment_time pickup_time courier orders',file=f)
+        for assignment_time,pickup_time,courier,bundle in assignments:
+            print(assignment_time,pickup_time,courier,*bundle,file=f)
+    with open(os.path.join(solution_dir,'solution_info_orders.txt'),'w') as f:
+        print('order placement_time ready_time pickup_time dropoff_time courier',file=f)
+        for row in order_rows:
+            print(*row,file=f)
+    with open(os.path.join(solution_dir,'solution_info_couriers.txt'),'w') as f:
+        print('courier departure_time origin destination',file=f)
+        for row in courier_moves:
+            print(*row,file=f)
+
+def generate_instance(instance_dir,factor,output_dir,solution_dir=None,jitter=100,seed=0):
+    orders,restaurants,couriers,instanceparams=read_instance_tables(instance_dir)
+    orders,restaurants,couriers,order_copy,courier_copy=scale_instance(orders,restaurants,couriers,factor,jitter,seed)
+    write_instance(output_dir,orders,restaurants,couriers,instanceparams)
+    if solution_dir:
+        write_solution(solution_dir,*build_feasible_solution(orders,restaurants,couriers,instanceparams,\
+                                                              order_copy,courier_copy))
+    return len(orders),len(restaurants),len(couriers)
+
+if __name__=='__main__':
+    console_input=sys.argv
+    instance_dir=parse_console_option(console_input,'instance_dir')
+    factor=float(parse_console_option(console_input,'factor','1'))
+    output_dir=parse_console_option(console_input,'output_dir')
+    solution_dir=parse_console_option(console_input,'solution_dir')
+    jitter=float(parse_console_option(console_input,'jitter','100'))
+    seed=int(parse_console_option(console_input,'seed','0'))
+    print(instance_dir,factor,output_dir,solution_dir)
+    n_orders,n_restaurants,n_couriers=generate_instance(instance_dir,factor,output_dir,solution_dir,jitter,seed)
+    print('number of orders:',n_orders)
+    print('number of restaurants:',n_restaurants)
+    print('number of couriers:',n_couriers)
@@ -0,0 +1,162 @@
+from __future__ import print_function
+import os
+import sys
+import math
+import bisect
+import time
+import numpy as np
+from compute_performance_summary import read_instance_tables,parse_console_option,parse_console_flag
+from generate_instance import write_solution
+from event_simulator import simulate
+from spatial_index import SpatialIndex,density_cell_size
+'''
+This script solves instances with a baseline rolling-horizon dispatcher, and writes its
+solutions in the format read by compute_performance_summary.py (solution_info_assignments.txt,
+solution_info_orders.txt and solution_info_couriers.txt). It takes as input:
+    1. instance directory: it is expected to contain files orders.txt, couriers.txt, restaurants.txt, and instance_parameters.txt
+    2. output (solution) directory: where the solution files are written (defaults to
+       <instance directory>/greedy)
+    3. interval: minutes between two dispatching decisions (defaults to 5)
+    4. max_bundle: maximum number of orders picked up together (defaults to 2)
+Alternatively, with instances_dir= and solutions_dir=, every instance of a tree (e.g.
+public_instances) is solved into solutions_dir/<instance>, as batch_performance_summary.py
+expects. Adding evaluate=yes evaluates each solution and prints its performance.
+Every interval minutes, the orders placed and not yet assigned are grouped by restaurant into
+bundles of consecutive ready times (each bundle's dropoffs in nearest-neighbor sequence), and
+bundles are matched, most urgent first, to the courier that can pick them up the earliest
+among those idle by the next decision. Idle couriers are kept in the grid index of
+spatial_index.py (cells sized by their density, at least a minute of travel wide), searched
+in rings around the restaurant, so each match only looks at the couriers close enough to
+beat the best one found. A match is committed only if the courier must leave before the next
+decision to pick the bundle up at its ready time; otherwise the bundle waits (and may grow).
+The decisions are made by GreedyPolicy, replayed by the discrete-event simulator of
+event_simulator.py, which carries out each assignment with travel times as traveltime() in
+compute_performance_summary.py.
+Example call:
+    python greedy_dispatcher.py instance_dir=../public_instances/7o100t100s1p125 evaluate=yes
+'''
+
+def make_bundles(pending,restaurant,ready,order_x,order_y,restaurant_x,restaurant_y,max_bundle,travel):
+    # pending: positions of the orders to bundle. Returns bundles (lists of positions of
+    # orders of the same restaurant, consecutive in ready time, in dropoff sequence) sorted
+    # by ready time
+    bundles=[]
+    pending=sorted(pending,key=lambda o:(restaurant[o],ready[o]))
+    i=0
+    while i<len(pending):
+        r=restaurant[pending[i]]
+        j=i+1
+        while j<len(pending) and j-i<max_bundle and restaurant[pending[j]]==r:
+            j+=1
+        # nearest-neighbor sequence from the restaurant
+        left=pending[i:j]
+        x,y=restaurant_x[r],restaurant_y[r]
+        bundle=[]
+        while left:
+            o=min(left,key=lambda o:travel(x,y,order_x[o],order_y[o]))
+            left.remove(o)
+            bundle.append(o)
+            x,y=order_x[o],order_y[o]
+        bundles.append(bundle)
+        i=j
+    bundles.sort(key=lambda b:max(ready[o] for o in b))
+    return bundles
+
+class GreedyPolicy(object):
+    # the dispatching decisions made at time t (see event_simulator.py)
+    def __init__(self,max_bundle=2):
+        self.max_bundle=max_bundle
+
+    def __call__(self,simulator,t):
+        s=simulator
+        travel=s.travel
+        horizon=t+s.interval
+        # couriers idle by the next decision, still on shift: among those idle now, those
+        # whose last dropoff comes by then and those whose shift starts by then
+        on=s.on_times_sorted
+        starting=s.couriers_by_on_time[bisect.bisect_right(on,t):bisect.bisect_right(on,horizon)]
+        candidates=s.idle.union([d for d in s.busy if s.free[d]<=horizon],starting)
+        idle=sorted(d for d in candidates\
+                    if s.free[d]<=horizon and s.on_time[d]<=horizon and max(s.free[d],t)<s.off_time[d])
+        xs,ys=np.array([s.courier_x[d] for d in idle]),np.array([s.courier_y[d] for d in idle])
+        # cells no narrower than a minute of travel: pickup bounds are in whole minutes, so
+        # narrower rings would only be walked without raising the bound
+        index=SpatialIndex(xs,ys,cell_size=max(density_cell_size(xs,ys),s.meters_per_minute))
+        taken=[False]*len(idle)
+        left=len(idle)
+        decisions=[]
+        for bundle in make_bundles(s.pending,s.restaurant,s.ready,s.order_x,s.order_y,s.restaurant_x,s.restaurant_y,\
+                                   self.max_bundle,travel):
+            if not left:
+                break
+            r=s.restaurant[bundle[0]]
+            rx,ry=s.restaurant_x[r],s.restaurant_y[r]
+            bundle_ready=max(s.ready[o] for o in bundle)
+            best=None
+            for ring,candidates in index.rings(rx,ry):
+                # lower bound of the pickup time of any courier in this ring or beyond
+                bound=max(bundle_ready,t+int(math.ceil(max(ring-1,0)*index.cell_size/s.meters_per_minute))+s.pickup_service_minutes)
+                if best is not None and bound>=best[0]:
+                    break
+                for p in candidates:
+                    if taken[p]:
+                        continue
+                    d=idle[p]
+                    departure=max(s.free[d],t)
+                    to_restaurant=travel(s.courier_x[d],s.courier_y[d],rx,ry)
+                    pickup=max(bundle_ready,departure+to_restaurant+s.pickup_service_minutes)
+                    if pickup<=s.off_time[d] and (best is None or (pickup,departure,d)<best[:3]):
+                        best=(pickup,departure,d,to_restaurant,p)
+            if best is None:
+                continue
+            pickup,departure,d,to_restaurant,p=best
+            # wait if the courier could still leave at the next decision and be on time
+            if max(s.free[d],horizon)+to_restaurant+s.pickup_service_minutes<=bundle_ready:
+                continue
+            taken[p]=True
+            left-=1
+            decisions.append((d,bundle))
+        return decisions
+
+def dispatch(orders,restaurants,couriers,instanceparams,interval=5,max_bundle=2):
+    # orders, restaurants, couriers, instanceparams: the tables as read from the instance
+    # files. Returns the solution as lists of assignment rows (assignment_time, pickup_time,
+    # courier, orders), order rows (order, placement_time, ready_time, pickup_time,
+    # dropoff_time, courier) and courier moves (courier, departure_time, origin,
+    # destination), each courier's moves in sequence, as write_solution expects
+    return simulate(orders,restaurants,couriers,instanceparams,GreedyPolicy(max_bundle),interval)
+
+def solve_instance(instance_dir,solution_dir,interval=5,max_bundle=2):
+    # solve an instance and write its solution; returns the number of orders assigned and
+    # the seconds taken to dispatch them
+    orders,restaurants,couriers,instanceparams=read_instance_tables(instance_dir)
+    start=time.perf_counter()
+    assignments,order_rows,courier_moves=dispatch(orders,restaurants,couriers,instanceparams,interval,max_bundle)
+    seconds=time.perf_counter()-start
+    write_solution(solution_dir,assignments,order_rows,courier_moves)
+    return len(order_rows),seconds
+
+if __name__=='__main__':
+    console_input=sys.argv
+    instance_dir=parse_console_option(console_input,'instance_dir')
+    output_dir=parse_console_option(console_input,'output_dir')
+    instances_dir=parse_console_option(console_input,'instances_dir')
+    solutions_dir=parse_console_option(console_input,'solutions_dir')
+    interval=int(parse_console_option(console_input,'interval','5'))
+    max_bundle=int(parse_console_option(console_input,'max_bundle','2'))
+    evaluate_solutions=parse_console_flag(console_input,'evaluate')
+    if instances_dir:
+        jobs=[(os.path.join(instances_dir,i),os.path.join(solutions_dir,i)) for i in sorted(os.listdir(instances_dir))\
+              if os.path.isdir(os.path.join(instances_dir,i))]
+    else:
+        jobs=[(instance_dir,output_dir or os.path.join(instance_dir,'greedy'))]
+    if evaluate_solutions:
+        from performance_evaluator import read_instance,read_solution,evaluate
+    for instance_dir,solution_dir in jobs:
+        n_assigned,seconds=solve_instance(instance_dir,solution_dir,interval,max_bundle)
+        print(os.path.basename(os.path.normpath(instance_dir)),'orders assigned:',n_assigned,\
+              'dispatch seconds: {0:.3f}'.format(seconds))
+        if evaluate_solutions:
+            result=evaluate(read_instance(instance_dir),read_solution(solution_dir))
+            print('    feasible:',result.feasible,'delivered: {0}/{1}'.format(result.total_delivered,result.total_orders),\
+                  'cost:',result.total_cost,'mean click-to-door: {0:.1f}'.format(result.order_performance['click-to-door'].mean()))
@@ -0,0 +1,270 @@
+from __future__ import print_function
+import bisect
+import pandas as pd
+'''
+Incremental evaluation of a solution that changes a few assignments at a time, as in the
+moves of a local search. IncrementalEvaluator keeps the solution as a set of Assignments
+(each with its bundle, dropoff times and the courier moves that serve it), the timeline of
+each courier, per-assignment and per-courier feasibility counts and running totals of the
+objective metrics. A delta (assignments removed and/or added, see apply) only updates the
+assignments it touches, the orders in their bundles and the (at most two per replaced
+assignment) couriers whose timelines change.
+Feasibility is tracked as the number of violations of each check of feasibility_checks in
+compute_performance_summary.py. The solution kept has one order row per order of each
+bundle (with the courier and dropoff time of its assignment): the counts are those of
+performance_evaluator.evaluate on solution(), which returns it as the frames of
+read_solution_information. A solution loaded with from_solution is kept that way, so its
+counts are those of the full evaluation of the loaded files only as long as their order rows
+agree with the assignments (one row per order, reported with the courier of the one
+assignment it is in); order rows that do not (an order in several bundles, or listed twice
+in one, or reported with another courier) are replaced by those of the assignments.
+'''
+
+class Assignment(object):
+    # an assignment together with what the three solution files say about it:
+    # assignment_time, pickup_time, courier, bundle (order ids, in dropoff sequence),
+    # dropoff_times (one per order of the bundle) and moves: the (departure_time, origin,
+    # destination) moves of the courier that serve the assignment, in sequence (origin 0
+    # stands for the on-location of the courier, as in solution_info_couriers.txt)
+    def __init__(self,assignment_time,pickup_time,courier,bundle,dropoff_times,moves):
+        self.assignment_time=assignment_time
+        self.pickup_time=pickup_time
+        self.courier=courier
+        self.bundle=list(bundle)
+        self.dropoff_times=list(dropoff_times)
+        self.moves=[(m[0],m[1] if m[1]!='0' else courier,m[2]) for m in moves]
+        if len(self.dropoff_times)!=len(self.bundle):
+            raise ValueError('an assignment needs one dropoff time per order of its bundle')
+
+def split_courier_moves(assignment_sol,order_sol,courier_sol):
+    # Assignments of a solution given as the frames of read_solution_information. The moves
+    # of each courier are given, in sequence, to its assignments sorted by pickup time: an
+    # assignment gets the moves up to the dropoff of the last order of its bundle, and the
+    # last assignment of the courier also gets the remaining moves. Also returns the moves of
+    # couriers without assignments. Order rows are then derived from the assignments, so
+    # order rows that disagree with the assignments (another courier, an order repeated) are
+    # not kept
+    dropoff_time=order_sol[order_sol.courier!='courier'].dropoff_time
+    dropoff_time=dict(zip(dropoff_time.index,dropoff_time.tolist()))
+    assignments=[Assignment(a.assignment_time,a.pickup_time,a.courier,a.bundle,\
+                            [dropoff_time[o] for o in a.bundle],[])\
+                 for a in assignment_sol.itertuples()]
+    by_courier={}
+    for i,a in enumerate(assignments):
+        by_courier.setdefault(a.courier,[]).append(i)
+    idle_moves={}
+    for d,moves in courier_sol.items():
+        if d not in by_courier:
+            idle_moves[d]=[tuple(m) for m in moves]
+            continue
+        sequence=sorted(by_courier[d],key=lambda i:(assignments[i].pickup_time,i))
+        k=0
+        for m in moves:
+            a=assignments[sequence[k]]
+            a.moves.append(tuple(m))
+            if k<len(sequence)-1 and a.bundle and m[2]==a.bundle[-1]:
+                k+=1
+    return assignments,idle_moves
+
+class IncrementalEvaluator(object):
+    # per-assignment violation counts (the checks that only involve one assignment)
+    assignment_checks=['assignments_before_placement','pickups_after_off_time',\
+                       'pickups_before_ready_time','dropoffs_out_of_sequence']
+    # per-courier violation counts (the checks that involve the timeline of a courier)
+    courier_checks=['discontinuous_moves','departures_before_arrivals',\
+                    'dropoff_location_mismatches','pickup_location_mismatches']
+
+    def __init__(self,instance,assignments=(),idle_moves=None):
+        # instance: an Instance (see performance_evaluator.py); idle_moves: moves of couriers
+        # that have no assignment, by courier
+        self.instance=instance
+        orders=instance.orders
+        couriers=instance.couriers
+        self.placement_time=dict(zip(orders.index,orders.placement_time.tolist()))
+        self.ready_time=dict(zip(orders.index,orders.ready_time.tolist()))
+        self.restaurant=dict(zip(orders.index,orders.restaurant))
+        self.on_time=dict(zip(couriers.index,couriers.on_time.tolist()))
+        self.off_time=dict(zip(couriers.index,couriers.off_time.tolist()))
+        self.guaranteed_earnings=dict(zip(couriers.index,\
+            ((couriers.off_time-couriers.on_time)*instance.guaranteed_pay_per_hour/60.0).tolist()))
+        self.assignments={}
+        self.assignment_state={}
+        self.courier_assignments={d:set() for d in couriers.index}
+        self.idle_moves={d:self.timed_moves(moves) for d,moves in (idle_moves or {}).items()}
+        self.timelines={}
+        self.courier_state={}
+        self.order_rows={}
+        self.next_id=0
+        self.totals=dict.fromkeys(['orders_in_several_assignments']+self.assignment_checks+self.courier_checks,0)
+        self.totals.update(delivered=0,overage=0,payment=0,trueup=0)
+        for d in couriers.index:
+            self.update_courier(d)
+        self.apply(added=assignments)
+
+    @classmethod
+    def from_solution(cls,instance,assignment_sol,order_sol,courier_sol):
+        # from the frames of read_solution_information (see split_courier_moves)
+        assignments,idle_moves=split_courier_moves(assignment_sol,order_sol,courier_sol)
+        return cls(instance,assignments,idle_moves)
+
+    def timed_moves(self,moves):
+        # (departure_time, origin, destination, arrival_time) of each move
+        if not moves:
+            return []
+        location_index=self.instance.location_index
+        origins=location_index.positions([m[1] for m in moves])
+        destinations=location_index.positions([m[2] for m in moves])
+        tt=location_index.travel_times(origins,destinations,self.instance.meters_per_minute).tolist()
+        return [(m[0],m[1],m[2],m[0]+t) for m,t in zip(moves,tt)]
+
+    def evaluate_assignment(self,a):
+        # violation counts of the checks that only involve assignment a, its timed moves
+        # and the click-to-door overage of its orders
+        placement=[self.placement_time[o] for o in a.bundle]
+        ready=[self.ready_time[o] for o in a.bundle]
+        ds=self.instance.dropoff_service_minutes
+        state={'assignments_before_placement':sum(a.assignment_time<p for p in placement),\
+               'pickups_after_off_time':int(self.off_time[a.courier]<a.pickup_time),\
+               'pickups_before_ready_time':sum(r>a.pickup_time for r in ready),\
+               'dropoffs_out_of_sequence':sum(a.dropoff_times[k]<a.dropoff_times[k-1]+ds\
+                                              for k in range(1,len(a.bundle))),\
+               'overage':sum(max(0,t-p-self.instance.target_click_to_door)\
+                             for t,p in zip(a.dropoff_times,placement))}
+        state['moves']=self.timed_moves(a.moves)
+        return state
+
+    def update_courier(self,d):
+        # rebuild the timeline of courier d and recompute its violation counts and payment
+        totals=self.totals
+        old=self.courier_state.get(d)
+        if old:
+            for key in self.courier_checks+['payment','trueup']:
+                totals[key]-=old[key]
+        assignments=sorted(self.courier_assignments[d],key=lambda i:(self.assignments[i].pickup_time,i))
+        moves=[m for i in assignments for m in self.assignment_state[i]['moves']]+self.idle_moves.get(d,[])
+        times=[self.on_time[d]]
+        places=[d]
+        discontinuous=0
+        for departure,origin,destination,arrival in moves:
+            discontinuous+=origin!=places[-1]
+            times+=[departure,arrival]
+            places+=['',destination]
+        place_at=lambda t:places[bisect.bisect_left(times,t)-1]
+        dropoff_mismatches=0
+        pickup_mismatches=0
+        orders_served=0
+        for i in assignments:
+            a=self.assignments[i]
+            dropoff_mismatches+=sum(place_at(t)!=o for o,t in zip(a.bundle,a.dropoff_times))
+            pickup_mismatches+=place_at(a.pickup_time)!=self.restaurant[a.bundle[0]]
+            orders_served+=len(a.bundle)
+        order_earnings=orders_served*self.instance.pay_per_order
+        guaranteed_earnings=self.guaranteed_earnings[d]
+        state={'discontinuous_moves':discontinuous,'departures_before_arrivals':int(sorted(times)!=times),\
+               'dropoff_location_mismatches':dropoff_mismatches,'pickup_location_mismatches':pickup_mismatches,\
+               'payment':max(order_earnings,guaranteed_earnings),'trueup':int(order_earnings<guaranteed_earnings)}
+        for key in self.courier_checks+['payment','trueup']:
+            totals[key]+=state[key]
+        self.courier_state[d]=state
+        self.timelines[d]=(times,places)
+
+    def count_order(self,o,rows):
+        # add rows (possibly negative) to the number of order rows of order o
+        before=self.order_rows.get(o,0)
+        self.order_rows[o]=before+rows
+        self.totals['orders_in_several_assignments']+=(before+rows>1)-(before>1)
+        self.totals['delivered']+=rows
+
+    def apply(self,removed=(),added=()):
+        # one delta: remove the assignments with the given ids and add the given Assignments;
+        # returns the ids of the added assignments. The delta is validated before anything
+        # changes: unknown ids raise a KeyError
+        removed=list(removed)
+        for i in removed:
+            if i not in self.assignments:
+                raise KeyError(i)
+        added_states=[]
+        for a in added:
+            for o in a.bundle:
+                if o not in self.placement_time:
+                    raise KeyError(o)
+            if a.courier not in self.on_time:
+                raise KeyError(a.courier)
+            if not a.bundle:
+                raise ValueError('assignment with an empty bundle: there is no order to pick up')
+            added_states.append((a,self.evaluate_assignment(a)))
+        affected=set()
+        for i in removed:
+            a=self.assignments.pop(i)
+            state=self.assignment_state.pop(i)
+            self.courier_assignments[a.courier].discard(i)
+            for key in self.assignment_checks+['overage']:
+                self.totals[key]-=state[key]
+            for o in a.bundle:
+                self.count_order(o,-1)
+            affected.add(a.courier)
+        ids=[]
+        for a,state in added_states:
+            i=self.next_id
+            self.next_id+=1
+            self.assignments[i]=a
+            self.assignment_state[i]=state
+            self.courier_assignments[a.courier].add(i)
+            for key in self.assignment_checks+['overage']:
+                self.totals[key]+=state[key]
+            for o in a.bundle:
+                self.count_order(o,1)
+            affected.add(a.courier)
+            ids.append(i)
+        for d in affected:
+            self.update_courier(d)
+        return ids
+
+    def add(self,assignment):
+        return self.apply(added=[assignment])[0]
+
+    def remove(self,assignment_id):
+        # returns the removed Assignment (e.g. to add it back when undoing a move)
+        assignment=self.assignments[assignment_id]
+        self.apply(removed=[assignment_id])
+        return assignment
+
+    def replace(self,assignment_id,assignment):
+        return self.apply(removed=[assignment_id],added=[assignment])[0]
+
+    def violation_counts(self):
+        # number of violations of each feasibility check
+        return {key:self.totals[key] for key in ['orders_in_several_assignments']+self.assignment_checks+self.courier_checks}
+
+    @property
+    def feasible(self):
+        return not any(self.violation_counts().values())
+
+    def metrics(self):
+        # summary metrics, as in PerformanceResult.metrics, and the total click-to-door overage
+        return {'feasible':self.feasible,'total_delivered':self.totals['delivered'],\
+                'total_orders':len(self.placement_time),'total_cost':self.totals['payment'],\
+                'proportion_trueup':self.totals['trueup']/(1.0*len(self.on_time)),\
+                'click_to_door_overage':self.totals['overage']}
+
+    def solution(self):
+        # the current solution as the (assignment_sol, order_sol, courier_sol) frames of
+        # read_solution_information: assignments in the order they were added, and the moves
+        # of each courier in the sequence of its timeline
+        assignments=[self.assignments[i] for i in sorted(self.assignments)]
+        assignment_sol=pd.DataFrame([[a.assignment_time,a.pickup_time,a.courier,a.bundle] for a in assignments],\
+                                    columns=['assignment_time','pickup_time','courier','bundle'])
+        rows=[(o,self.placement_time[o],self.ready_time[o],a.pickup_time,t,a.courier)\
+              for a in assignments for o,t in zip(a.bundle,a.dropoff_times)]
+        order_sol=pd.DataFrame(rows,columns=['order','placement_time','ready_time','pickup_time','dropoff_time','courier'])
+        for c in ['placement_time','ready_time','pickup_time','dropoff_time']:
+            order_sol[c]=pd.to_numeric(order_sol[c])
+        order_sol.set_index('order',inplace=True)
+        courier_sol={}
+        for d in self.courier_assignments:
+            sequence=sorted(self.courier_assignments[d],key=lambda i:(self.assignments[i].pickup_time,i))
+            moves=[list(m[:3]) for i in sequence for m in self.assignment_state[i]['moves']]
+            moves+=[list(m[:3]) for m in self.idle_moves.get(d,[])]
+            if moves:
+                courier_sol[d]=moves
+        return assignment_sol,order_sol,courier_sol
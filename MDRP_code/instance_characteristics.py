@@ -0,0 +1,248 @@
+from __future__ import print_function
+import os
+import sys
+import math
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from compute_performance_summary import read_instance_tables,parse_console_option,parse_console_flag
+'''
+This script computes the summary statistics of instance_characteristics.txt from the instance
+files, for a set of instances in parallel. It takes as input:
+    1. instances directory: it contains one directory per instance (defaults to public_instances);
+       alternatively, instance_dir= gives a single instance
+    2. output directory: instance_characteristics.txt of each instance is written to
+       output_dir/<instance> (defaults to ./instance_characteristics)
+    3. workers: number of processes computing instances in parallel (defaults to the number
+       of CPUs)
+    4. chunk: number of restaurant pairs whose distances are computed at once (defaults to
+       4194304), which bounds the memory taken by the statistics between restaurants
+Adding compare=yes compares each file with the instance_characteristics.txt shipped in the
+instance directory, and reports the lines that differ (other than the degree of dynamism, see
+below).
+Distances are euclidean, in meters, and travel times as traveltime() in
+compute_performance_summary.py. The distribution between restaurants is over all ordered
+pairs of distinct restaurants; it is accumulated chunk by chunk, and its percentiles are
+found exactly in a second pass over the chunks, which only keeps the distances falling in
+the histogram bins of those percentiles. Preparation is ready time minus placement time; the
+pickup flexibility of an order is the click-to-door target (soft) or maximum (hard) minus
+preparation minus the travel time from restaurant to customer, floored at 0, and its response
+time the target or maximum minus the travel time, or 0 when its pickup flexibility is 0.
+The operating period runs until the maximum click-to-door after the last placement. The
+degree of dynamism of the shipped files was computed with a definition that is not
+documented; in its place, the file has the dynamism measure of van Lon et al. (2016) over
+placement times, which measures how evenly orders are revealed over the operating period,
+under a label of its own. The two are not comparable, so compare=yes skips both lines (all
+other lines match the shipped files).
+Example call:
+    python instance_characteristics.py instances_dir=../public_instances output_dir=characteristics compare=yes workers=8
+'''
+
+# percentiles reported in instance_characteristics.txt
+percentiles=[0.1,0.5,0.9]
+# lines of instance_characteristics.txt not compared with the shipped files
+uncompared_prefix='degree of dynamism'
+
+class ChunkedDescription(object):
+    # describe(percentiles) of values seen in chunks, in two passes: add() every chunk,
+    # then collect() every chunk again (in any order) before describe()
+    def __init__(self,upper_bound,bins=65536):
+        # upper_bound: no value is larger
+        self.count=0
+        self.mean=0.0
+        self.m2=0.0
+        self.min=np.inf
+        self.max=-np.inf
+        self.bin_width=max(float(upper_bound),1.0)/bins
+        self.histogram=np.zeros(bins,dtype=np.int64)
+        self.collected=[]
+
+    def bin(self,values):
+        return np.minimum((values/self.bin_width).astype(np.int64),len(self.histogram)-1)
+
+    def add(self,values):
+        # count, mean and sum of squared deviations merged as in Chan et al.
+        n=len(values)
+        if not n:
+            return
+        mean=values.mean()
+        m2=((values-mean)**2).sum()
+        delta=mean-self.mean
+        total=self.count+n
+        self.mean+=delta*n/total
+        self.m2+=m2+delta**2*self.count*n/total
+        self.count=total
+        self.min=min(self.min,values.min())
+        self.max=max(self.max,values.max())
+        self.histogram+=np.bincount(self.bin(values),minlength=len(self.histogram))
+
+    def ranks(self):
+        # ranks (in sorted order) of the values the percentiles interpolate between
+        positions=[q*(self.count-1) for q in percentiles]
+        return sorted(set([int(math.floor(p)) for p in positions]+[int(math.ceil(p)) for p in positions]))
+
+    def collect(self,values):
+        cumulative=np.cumsum(self.histogram)
+        bins=np.searchsorted(cumulative,np.array(self.ranks())+1)
+        self.collected.append(values[np.isin(self.bin(values),bins)])
+
+    def describe(self):
+        # as pandas' describe(percentiles), without the count
+        cumulative=np.cumsum(self.histogram)
+        collected=np.sort(np.concatenate(self.collected)) if self.collected else np.array([])
+        ranked={}
+        for rank in self.ranks() if self.count else []:
+            b=np.searchsorted(cumulative,rank+1)
+            # the values of bin b start at rank cumulative[b-1]; the collected values of the
+            # bins below b come first
+            below=int(np.isin(self.bin(collected),np.arange(b)).sum())
+            ranked[rank]=collected[below+rank-(cumulative[b-1] if b>0 else 0)]
+        values={'mean':self.mean if self.count else np.nan,\
+                'std':math.sqrt(self.m2/(self.count-1)) if self.count>1 else np.nan,\
+                'min':self.min if self.count else np.nan}
+        for q in percentiles:
+            p=q*(self.count-1)
+            low,high=int(math.floor(p)),int(math.ceil(p))
+            values['{0:g}%'.format(100*q)]=ranked[low]+(ranked[high]-ranked[low])*(p-low) if self.count else np.nan
+        values['max']=self.max if self.count else np.nan
+        return pd.Series(values)
+
+def restaurant_pair_chunks(x,y,chunk):
+    # distances between all ordered pairs of distinct restaurants (x, y arrays), a block of
+    # rows at a time
+    rows=max(chunk//max(len(x),1),1)
+    for start in range(0,len(x),rows):
+        stop=min(start+rows,len(x))
+        distances=np.hypot(x[start:stop,None]-x[None,:],y[start:stop,None]-y[None,:])
+        distinct=np.arange(start,stop)[:,None]!=np.arange(len(x))[None,:]
+        yield distances[distinct]
+
+def restaurant_distance_description(x,y,meters_per_minute,chunk=4194304):
+    # the meters and minutes between restaurants table, computed chunk by chunk
+    diameter=math.hypot(x.max()-x.min(),y.max()-y.min()) if len(x) else 0.0
+    meters=ChunkedDescription(diameter)
+    minutes=ChunkedDescription(math.ceil(diameter/meters_per_minute))
+    for collect in [False,True]:
+        for distances in restaurant_pair_chunks(x,y,chunk):
+            for description,values in [(meters,distances),(minutes,np.ceil(distances/meters_per_minute))]:
+                if collect:
+                    description.collect(values)
+                else:
+                    description.add(values)
+    return pd.DataFrame({'meters between restaurants':meters.describe(),'minutes between restaurants':minutes.describe()})
+
+def dynamism(times,period):
+    # dynamism of van Lon et al. (2016): 1 minus how much the gaps between consecutive
+    # times fall short of even spacing (period/number of times), where shortfalls carry over
+    # to the next gap in proportion to the current one
+    times=np.sort(np.asarray(times,dtype=np.float64))
+    if len(times)<2:
+        return 0.0
+    theta=float(period)/len(times)
+    gaps=np.diff(times)
+    shortfall=0.0 # shortfall of the previous gap
+    total_shortfall=0.0
+    total_maximum=0.0
+    previous_gap=theta
+    for gap in gaps.tolist():
+        if gap<theta:
+            carry=(theta-previous_gap)/theta*shortfall
+            shortfall=theta-gap+carry
+            total_maximum+=theta+carry
+        else:
+            shortfall=0.0
+            total_maximum+=theta
+        total_shortfall+=shortfall
+        previous_gap=gap
+    return 1-total_shortfall/total_maximum
+
+def instance_characteristics(orders,restaurants,couriers,instanceparams,chunk=4194304):
+    # orders, restaurants, couriers, instanceparams: the tables as read from the instance
+    # files. Returns the header values (a dict) and the three tables of the file
+    meters_per_minute=instanceparams.at[0,'meters_per_minute']
+    target_click_to_door=instanceparams.at[0,'target click-to-door']
+    maximum_click_to_door=instanceparams.at[0,'maximum click-to-door']
+    placement=orders.placement_time.to_numpy(dtype=np.int64)
+    period=int(placement.max()+maximum_click_to_door) if len(placement) else 0
+    header={'number of orders':len(orders),'number of restaurants':len(restaurants),\
+            'number of couriers':len(couriers),\
+            'total courier hours':float((couriers.off_time-couriers.on_time).sum())/60,\
+            'operating period (minutes)':period,\
+            'degree of dynamism (van Lon et al.)':dynamism(placement,period)}
+
+    restaurant_position=pd.Index(restaurants.restaurant).get_indexer(orders.restaurant)
+    restaurant_x=restaurants.x.to_numpy(dtype=np.float64)
+    restaurant_y=restaurants.y.to_numpy(dtype=np.float64)
+    meters=np.hypot(orders.x.to_numpy(dtype=np.float64)-restaurant_x[restaurant_position],\
+                    orders.y.to_numpy(dtype=np.float64)-restaurant_y[restaurant_position])
+    minutes=np.ceil(meters/meters_per_minute)
+    delivery=pd.DataFrame({'meters from restaurant to delivery location':meters,\
+                           'minutes from restaurant to delivery location':minutes})
+
+    between=restaurant_distance_description(restaurant_x,restaurant_y,meters_per_minute,chunk)
+
+    preparation=orders.ready_time.to_numpy(dtype=np.int64)-placement
+    soft_pickup_flex=np.maximum(target_click_to_door-preparation-minutes,0)
+    hard_pickup_flex=np.maximum(maximum_click_to_door-preparation-minutes,0)
+    times=pd.DataFrame({'preparation':preparation,\
+                        'soft_response_time':np.where(soft_pickup_flex>0,target_click_to_door-minutes,0),\
+                        'hard_response_time':np.where(hard_pickup_flex>0,maximum_click_to_door-minutes,0),\
+                        'soft_pickup_flex':soft_pickup_flex,'hard_pickup_flex':hard_pickup_flex})
+    describe=lambda frame:frame.describe(percentiles=percentiles).drop('count')
+    return header,[describe(delivery),between,describe(times)]
+
+def write_instance_characteristics(characteristics_file,header,tables):
+    with open(characteristics_file,'w') as f:
+        for name in ['number of orders','number of restaurants','number of couriers']:
+            print(name+':',header[name],file=f)
+        print('total courier hours:','{0:.2f}'.format(header['total courier hours']),file=f)
+        print('operating period (minutes):',header['operating period (minutes)'],file=f)
+        print('',file=f)
+        print('degree of dynamism (van Lon et al.):','{0:.2f}'.format(header['degree of dynamism (van Lon et al.)']),file=f)
+        for table in tables:
+            print('\n',file=f)
+            print(table.to_string(float_format=lambda x:'{0:.2f}'.format(x)),file=f)
+
+def compute_instance_characteristics(instance_dir,output_dir,chunk=4194304,compare=False):
+    # runs in a worker process: write instance_characteristics.txt of an instance to
+    # output_dir; returns the lines that differ from the shipped file if compare
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    characteristics_file=os.path.join(output_dir,'instance_characteristics.txt')
+    write_instance_characteristics(characteristics_file,*instance_characteristics(*read_instance_tables(instance_dir),chunk=chunk))
+    shipped_file=os.path.join(instance_dir,'instance_characteristics.txt')
+    if not compare or not os.path.exists(shipped_file):
+        return None
+    with open(characteristics_file) as f, open(shipped_file) as g:
+        computed,shipped=[[line for line in h.read().splitlines() if not line.startswith(uncompared_prefix)] for h in (f,g)]
+    return [line for line,other in zip(computed,shipped) if line!=other]+computed[len(shipped):]+shipped[len(computed):]
+
+def batch_instance_characteristics(instance_dirs,output_dir,workers=None,chunk=4194304,compare=False):
+    # {instance directory: differing lines (or None)} over instances computed in parallel
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures={executor.submit(compute_instance_characteristics,instance_dir,\
+                                 os.path.join(output_dir,os.path.basename(os.path.normpath(instance_dir))),\
+                                 chunk,compare):instance_dir for instance_dir in instance_dirs}
+        return {futures[future]:future.result() for future in concurrent.futures.as_completed(futures)}
+
+if __name__=='__main__':
+    console_input=sys.argv
+    instance_dir=parse_console_option(console_input,'instance_dir')
+    instances_dir=parse_console_option(console_input,'instances_dir',os.path.join(os.path.pardir,'public_instances'))
+    output_dir=parse_console_option(console_input,'output_dir',os.path.join(os.path.curdir,'instance_characteristics'))
+    workers=parse_console_option(console_input,'workers')
+    chunk=int(parse_console_option(console_input,'chunk','4194304'))
+    compare=parse_console_flag(console_input,'compare')
+    if instance_dir:
+        instance_dirs=[instance_dir]
+    else:
+        instance_dirs=[os.path.join(instances_dir,i) for i in sorted(os.listdir(instances_dir))\
+                       if os.path.exists(os.path.join(instances_dir,i,'orders.txt'))]
+    print(len(instance_dirs),'instances',output_dir)
+    differences=batch_instance_characteristics(instance_dirs,output_dir,int(workers) if workers else None,chunk,compare)
+    for instance_dir in sorted(differences):
+        if differences[instance_dir]:
+            print(os.path.basename(os.path.normpath(instance_dir)),'differs from the shipped file in:')
+            for line in differences[instance_dir]:
+                print('   ',line)
+    print('Instance characteristics were written to directory:',output_dir)
@@ -0,0 +1,61 @@
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+'''
+Dense integer index over the locations of an instance (orders, restaurants and couriers)
+with their coordinates stored in contiguous arrays, so that travel times can be computed
+for many moves at once with the same model as traveltime() in compute_performance_summary.py:
+ceil(euclidean distance in meters / meters per minute).
+'''
+
+def batch_traveltime(origin_x,origin_y,destination_x,destination_y,meters_per_minute):
+    # vectorized traveltime(); arguments are arrays of coordinates (or anything that broadcasts)
+    dist=np.sqrt((destination_x-origin_x)**2+(destination_y-origin_y)**2)
+    return np.ceil(dist/meters_per_minute)
+
+class LocationIndex(object):
+    def __init__(self,ids,x,y,groups=None):
+        # ids: location ids, mapped to positions 0..n-1 in the given order
+        # x,y: coordinates (in meters) of each location
+        # groups: optional dict mapping a group name ('orders', 'restaurants', 'couriers')
+        #         to the slice of positions it occupies
+        self.ids=pd.Index(ids)
+        self.x=np.ascontiguousarray(x,dtype=np.float64)
+        self.y=np.ascontiguousarray(y,dtype=np.float64)
+        self.groups=groups if groups is not None else {}
+
+    @classmethod
+    def from_locations(cls,locations):
+        # from the locations frame built by read_instance_information
+        return cls(locations.index,locations.x.to_numpy(dtype=np.float64),locations.y.to_numpy(dtype=np.float64))
+
+    @classmethod
+    def from_instance(cls,orders,restaurants,couriers):
+        # from the order, restaurant and courier frames (indexed by id) built by
+        # read_instance_information; positions follow the same order as its locations frame
+        frames=[('orders',orders),('restaurants',restaurants),('couriers',couriers)]
+        groups={}
+        start=0
+        for name,frame in frames:
+            groups[name]=slice(start,start+len(frame))
+            start+=len(frame)
+        ids=np.concatenate([frame.index.to_numpy(dtype=object) for _,frame in frames])
+        x=np.concatenate([frame.x.to_numpy(dtype=np.float64) for _,frame in frames])
+        y=np.concatenate([frame.y.to_numpy(dtype=np.float64) for _,frame in frames])
+        return cls(ids,x,y,groups)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self,labels):
+        # integer positions of location ids; unknown ids raise a KeyError
+        positions=self.ids.get_indexer(labels)
+        missing=positions<0
+        if missing.any():
+            raise KeyError(np.asarray(labels,dtype=object)[missing][0])
+        return positions
+
+    def travel_times(self,origins,destinations,meters_per_minute):
+        # travel time of each (origin, destination) pair of positions
+        return batch_traveltime(self.x[origins],self.y[origins],\
+                                self.x[destinations],self.y[destinations],meters_per_minute)
@@ -0,0 +1,377 @@
+from __future__ import print_function
+import os
+import sys
+import math
+import time
+import bisect
+import heapq
+from compute_performance_summary import parse_console_option,parse_console_flag
+'''
+Online evaluation of a solution while it is being produced. OnlineEvaluator consumes the
+records of the three solution files as they come (each record is a line of one of the files,
+prefixed by its kind: 'assignment', 'move' or 'order'), in any interleaving, and keeps the
+feasibility checks of compute_performance_summary.py and running metrics up to date with
+a constant amount of work per record (and a binary search or heap operation within the
+timeline of one courier). Each violation is reported as soon as the records that reveal it
+have been seen, to an optional callback.
+The checks that only involve one record (placement, ready and off times) are done when it
+arrives; an order in several assignments when its second assignment (or report) arrives;
+dropoff sequencing as soon as the dropoff times of two consecutive orders of a bundle are
+known; continuity and departures before arrivals as each move of a courier is appended to
+its timeline (the moves of each courier must come in sequence, as in the courier file). The
+location of a courier at a pickup or dropoff time is checked as soon as its timeline reaches
+that time (or by finish() for the rest, and for couriers whose timeline is not sorted, as
+then later moves may still change it).
+Violations are counted as the full evaluation counts them, except for the location checks
+of couriers with departures before arrivals: the full evaluation bisects their unsorted
+final timeline, while here the checks resolved while the timeline was still sorted stand.
+Violations are reported as in feasibility_check.txt, except that an assignment is a list
+[assignment_time, pickup_time, courier, bundle], dropoffs out of sequence list the dropoff
+times of the bundle known at the time (None for the others), and departures before arrivals
+are reported once per courier as (courier, departure_time, time of the previous event of its
+timeline).
+Short lines are padded as read_order_arrays of solution_arrays.py pads them: missing times
+are nan, and an order or assignment without courier is neither paid for nor located (an
+order row counts as delivered only without missing fields, as in the full evaluation); a
+move without departure time or destination is left out of the timeline.
+The script replays the stream of records written by event_simulator.py (stream=), following
+it as it grows if follow=yes, or a solution directory (input_dir=), and prints violations as
+they are found and the running metrics at the end:
+    python online_evaluator.py instance_dir=../public_instances/7o100t100s1p125 stream=day.stream follow=yes
+'''
+
+# kinds of records, and the solution file each one is a line of
+record_files={'assignment':'solution_info_assignments.txt','order':'solution_info_orders.txt',\
+              'move':'solution_info_couriers.txt'}
+
+def number(value):
+    # a time read from a solution file (int when integral, nan when missing)
+    try:
+        value=float(value)
+    except ValueError:
+        return float('nan')
+    return int(value) if value.is_integer() else value
+
+def parse_record(line):
+    # (kind, fields) of a line of a record stream, or None for blank and header lines
+    fields=line.split()
+    if len(fields)<2 or fields[0] not in record_files:
+        return None
+    return record_fields(fields[0],fields[1:])
+
+def time_field(value):
+    # a time of an assignment or move row: nan when missing, and ValueError when it is not
+    # a number (a header line)
+    return int(float(value)) if value else float('nan')
+
+def record_fields(kind,fields):
+    # (kind, fields) of a line of the solution file of that kind (split), or None for headers;
+    # the fields missing at the end of a short line are read as read_order_arrays of
+    # solution_arrays.py reads them: nan times, and None for ids (no courier, origin or
+    # destination)
+    fields=fields+['']*(6-len(fields))
+    try:
+        if kind=='assignment':
+            bundle=[o for o in fields[3:] if o]
+            return kind,(time_field(fields[0]),time_field(fields[1]),fields[2] or None,bundle)
+        if kind=='move':
+            return kind,(fields[0],time_field(fields[1]),fields[2] or None,fields[3] or None)
+        if kind=='order':
+            if fields[5]=='courier':
+                return None
+            return kind,(fields[0],number(fields[1]),number(fields[2]),number(fields[3]),number(fields[4]),fields[5] or None)
+    except ValueError:
+        return None # header line
+    raise ValueError('unknown kind of record: {0}'.format(kind))
+
+def format_record(kind,fields):
+    # the line of a record stream of a record of a solution file (see Simulator)
+    return ' '.join(str(f) for f in [kind]+[g for f in fields for g in (f if isinstance(f,list) else [f])])
+
+def records_from_solution(input_dir):
+    # the records of a solution directory: its assignments, then its orders, then its moves
+    for kind in ['assignment','order','move']:
+        with open(os.path.join(input_dir,record_files[kind])) as f:
+            for line in f:
+                fields=line.split()
+                record=record_fields(kind,fields) if fields else None
+                if record:
+                    yield record
+
+def follow_records(stream_file,poll_seconds=0.2,timeout=None):
+    # the records of a stream file as they are appended to it (waiting for the file to be
+    # created), until a line 'end' or until nothing has been appended for timeout seconds
+    # (if given)
+    waited=0.0
+    while not os.path.exists(stream_file):
+        if timeout is not None and waited>=timeout:
+            return
+        time.sleep(poll_seconds)
+        waited+=poll_seconds
+    with open(stream_file) as f:
+        line=''
+        waited=0.0
+        while True:
+            chunk=f.readline()
+            if not chunk:
+                if timeout is not None and waited>=timeout:
+                    return
+                time.sleep(poll_seconds)
+                waited+=poll_seconds
+                continue
+            waited=0.0
+            line+=chunk
+            if not line.endswith('\n'):
+                continue # a line still being written
+            if line.strip()=='end':
+                return
+            record=parse_record(line)
+            line=''
+            if record:
+                yield record
+
+class OnlineEvaluator(object):
+    checks=['orders_in_several_assignments','assignments_before_placement','pickups_after_off_time',\
+            'pickups_before_ready_time','dropoffs_out_of_sequence','discontinuous_moves',\
+            'departures_before_arrivals','dropoff_location_mismatches','pickup_location_mismatches']
+
+    def __init__(self,instance,on_violation=None):
+        # instance: an Instance (see performance_evaluator.py); on_violation: optional
+        # callback, called with the check and the violation as soon as it is found
+        self.instance=instance
+        self.on_violation=on_violation
+        orders=instance.orders
+        couriers=instance.couriers
+        self.placement_time=dict(zip(orders.index,orders.placement_time.tolist()))
+        self.ready_time=dict(zip(orders.index,orders.ready_time.tolist()))
+        self.restaurant=dict(zip(orders.index,orders.restaurant))
+        self.on_time=dict(zip(couriers.index,couriers.on_time.tolist()))
+        self.off_time=dict(zip(couriers.index,couriers.off_time.tolist()))
+        self.guaranteed_earnings=dict(zip(couriers.index,\
+            ((couriers.off_time-couriers.on_time)*instance.guaranteed_pay_per_hour/60.0).tolist()))
+        locations=instance.location_index
+        self.location_x=dict(zip(locations.ids,locations.x.tolist()))
+        self.location_y=dict(zip(locations.ids,locations.y.tolist()))
+        self.violations={check:[] for check in self.checks}
+        # orders: times assigned and reported, and (bundle, position) in their assignments
+        self.times_assigned={}
+        self.times_reported={}
+        self.order_bundles={}
+        self.dropoff_time={}
+        # couriers: timeline (times and places, as in courier_timeline.py), pending location
+        # checks (a heap of (time, sequence, check, expected place, violation fields)) and tallies
+        self.timelines={d:([t],[d]) for d,t in self.on_time.items()}
+        self.timeline_sorted=dict.fromkeys(self.on_time,True)
+        self.pending_locations={d:[] for d in self.on_time}
+        self.deferred_locations=[] # (courier, check) at times not after the on time (see finish)
+        self.sequence=0
+        self.orders_served=dict.fromkeys(self.on_time,0)
+        self.bundles=dict.fromkeys(self.on_time,0)
+        self.delivered=0 # order rows without missing fields
+        self.dropped_off=0 # order rows with a dropoff time
+        self.click_to_door=0
+        self.overage=0
+        self.payment=sum(self.guaranteed_earnings.values())
+        self.trueup=sum(1 for g in self.guaranteed_earnings.values() if g>0)
+
+    def violation(self,check,violation):
+        self.violations[check].append(violation)
+        if self.on_violation:
+            self.on_violation(check,violation)
+
+    def record(self,kind,fields):
+        # consume a record (see parse_record)
+        if kind=='assignment':
+            self.assignment(*fields)
+        elif kind=='move':
+            self.move(*fields)
+        elif kind=='order':
+            self.order(*fields)
+        else:
+            raise ValueError('unknown kind of record: {0}'.format(kind))
+
+    def consume(self,records):
+        # consume records (e.g. follow_records) until they end, then finish
+        for kind,fields in records:
+            self.record(kind,fields)
+        self.finish()
+        return self
+
+    def count_order(self,o,assigned,reported):
+        # an order is in several assignments once it is reported and assigned at least
+        # twice in total (counted once, as in the full evaluation)
+        before=self.times_assigned.get(o,0)*self.times_reported.get(o,0)>1
+        self.times_assigned[o]=self.times_assigned.get(o,0)+assigned
+        self.times_reported[o]=self.times_reported.get(o,0)+reported
+        if not before and self.times_assigned[o]*self.times_reported[o]>1:
+            self.violation('orders_in_several_assignments',o)
+
+    def assignment(self,assignment_time,pickup_time,courier,bundle):
+        for o in bundle:
+            if o not in self.placement_time:
+                raise KeyError(o)
+        if courier is not None and courier not in self.off_time:
+            raise KeyError(courier)
+        if not bundle:
+            raise ValueError('assignment with an empty bundle: there is no order to pick up')
+        row=[assignment_time,pickup_time,courier,list(bundle)]
+        for o in bundle:
+            if assignment_time<self.placement_time[o]:
+                self.violation('assignments_before_placement',(assignment_time,self.placement_time[o],o,row))
+        if courier is not None and self.off_time[courier]<pickup_time:
+            self.violation('pickups_after_off_time',(self.off_time[courier],pickup_time,row))
+        for o in bundle:
+            if self.ready_time[o]>pickup_time:
+                self.violation('pickups_before_ready_time',(pickup_time,self.ready_time[o],row))
+        for o in set(bundle):
+            self.count_order(o,1,0)
+        bundle=list(bundle)
+        for k,o in enumerate(bundle):
+            self.order_bundles.setdefault(o,[]).append((bundle,k))
+        for k in range(1,len(bundle)):
+            self.check_sequence(bundle,k)
+        if courier is None:
+            return # a short row without courier: nobody to pay or to locate
+        self.bundles[courier]+=1
+        r=self.restaurant[bundle[0]]
+        self.expect(courier,pickup_time,'pickup_location_mismatches',r,(bundle[0],r,pickup_time))
+
+    def order(self,o,placement_time,ready_time,pickup_time,dropoff_time,courier):
+        # an order row (only its dropoff time and courier are checked, as in the full
+        # evaluation; an order reported twice takes the dropoff time of its last row)
+        if o not in self.placement_time:
+            raise KeyError(o)
+        self.count_order(o,0,1)
+        self.dropoff_time[o]=dropoff_time
+        if courier is not None and all(t==t for t in [placement_time,ready_time,pickup_time,dropoff_time]):
+            self.delivered+=1 # (the full evaluation counts the complete rows)
+        if dropoff_time==dropoff_time: # not nan
+            self.dropped_off+=1
+            click_to_door=dropoff_time-self.placement_time[o]
+            self.click_to_door+=click_to_door
+            self.overage+=max(0,click_to_door-self.instance.target_click_to_door)
+        # the pairs of consecutive dropoffs the order is in, each checked once (an order listed
+        # at consecutive positions of a bundle is in the same pair twice)
+        pairs={}
+        for bundle,k in self.order_bundles.get(o,[]):
+            for j in [k,k+1]:
+                if 0<j<len(bundle):
+                    pairs[(id(bundle),j)]=bundle
+        for (_,j),bundle in pairs.items():
+            self.check_sequence(bundle,j)
+        if courier in self.off_time:
+            self.serve(courier)
+            self.expect(courier,dropoff_time,'dropoff_location_mismatches',o,(o,dropoff_time))
+
+    def serve(self,courier):
+        # one more order served by a courier: update its payment and true-up
+        pay=self.instance.pay_per_order
+        guaranteed=self.guaranteed_earnings[courier]
+        served=self.orders_served[courier]
+        self.payment+=max((served+1)*pay,guaranteed)-max(served*pay,guaranteed)
+        self.trueup+=int((served+1)*pay<guaranteed)-int(served*pay<guaranteed)
+        self.orders_served[courier]=served+1
+
+    def check_sequence(self,bundle,k):
+        # dropoff k of a bundle must come at least the dropoff service time after dropoff k-1
+        before,after=self.dropoff_time.get(bundle[k-1]),self.dropoff_time.get(bundle[k])
+        if before is None or after is None:
+            return
+        if after<before+self.instance.dropoff_service_minutes:
+            self.violation('dropoffs_out_of_sequence',([self.dropoff_time.get(o) for o in bundle],after,bundle))
+
+    def move(self,courier,departure_time,origin,destination):
+        if courier not in self.on_time:
+            raise KeyError(courier)
+        if destination is None or departure_time!=departure_time:
+            return # a short row: no move to append to the timeline
+        origin=origin if origin!='0' else courier
+        for place in [origin,destination]:
+            if place not in self.location_x:
+                raise KeyError(place)
+        times,places=self.timelines[courier]
+        if origin!=places[-1]:
+            self.violation('discontinuous_moves',(courier,origin,places[-1]))
+        dist=math.sqrt((self.location_x[destination]-self.location_x[origin])**2\
+                       +(self.location_y[destination]-self.location_y[origin])**2)
+        arrival=departure_time+math.ceil(dist/self.instance.meters_per_minute)
+        if self.timeline_sorted[courier] and departure_time<times[-1]:
+            self.timeline_sorted[courier]=False
+            self.violation('departures_before_arrivals',(courier,departure_time,times[-1]))
+        times+=[departure_time,arrival]
+        places+=['',destination]
+        self.resolve(courier)
+
+    def expect(self,courier,t,check,place,fields):
+        # the courier must be at place at time t; at times not after its on time (or nan),
+        # the place is that of the end of its timeline (as bisect finds it)
+        self.sequence+=1
+        if not t>self.on_time[courier]:
+            self.deferred_locations.append((courier,(t,self.sequence,check,place,fields)))
+            return
+        heapq.heappush(self.pending_locations[courier],(t,self.sequence,check,place,fields))
+        self.resolve(courier)
+
+    def place_at(self,courier,t):
+        times,places=self.timelines[courier]
+        return places[bisect.bisect_left(times,t)-1]
+
+    def resolve(self,courier,final=False):
+        # check the pending locations of a courier that its timeline already determines
+        # (those not after its last event, while the timeline is sorted)
+        pending=self.pending_locations[courier]
+        times=self.timelines[courier][0]
+        while pending and (final or (self.timeline_sorted[courier] and pending[0][0]<=times[-1])):
+            self.check_location(courier,heapq.heappop(pending))
+
+    def check_location(self,courier,pending):
+        t,_,check,place,fields=pending
+        actual=self.place_at(courier,t)
+        if actual!=place:
+            self.violation(check,fields+(actual,))
+
+    def finish(self):
+        # check the locations still pending, now that every move has been seen
+        for courier in self.pending_locations:
+            self.resolve(courier,final=True)
+        for courier,pending in self.deferred_locations:
+            self.check_location(courier,pending)
+        self.deferred_locations=[]
+
+    def violation_counts(self):
+        return {check:len(self.violations[check]) for check in self.checks}
+
+    @property
+    def feasible(self):
+        return not any(self.violations.values())
+
+    def metrics(self):
+        # running summary metrics, as in PerformanceResult.metrics, with the total and mean
+        # click-to-door and the total click-to-door overage of the orders delivered so far
+        return {'feasible':self.feasible,'total_delivered':self.delivered,\
+                'total_orders':len(self.placement_time),'total_cost':self.payment,\
+                'proportion_trueup':self.trueup/(1.0*len(self.on_time)),\
+                'click_to_door':self.click_to_door,'mean_click_to_door':self.click_to_door/(1.0*max(self.dropped_off,1)),\
+                'click_to_door_overage':self.overage}
+
+if __name__=='__main__':
+    from performance_evaluator import read_instance
+    console_input=sys.argv
+    instance_dir=parse_console_option(console_input,'instance_dir')
+    stream_file=parse_console_option(console_input,'stream')
+    input_dir=parse_console_option(console_input,'input_dir')
+    follow=parse_console_flag(console_input,'follow')
+    timeout=parse_console_option(console_input,'timeout')
+    print(instance_dir,stream_file or input_dir)
+    start=time.perf_counter()
+    report=lambda check,violation:print('{0:.3f}s'.format(time.perf_counter()-start),check+':',violation)
+    evaluator=OnlineEvaluator(read_instance(instance_dir),report)
+    if stream_file and follow:
+        records=follow_records(stream_file,timeout=float(timeout) if timeout else None)
+    elif stream_file:
+        records=(r for r in (parse_record(line) for line in open(stream_file)) if r)
+    else:
+        records=records_from_solution(input_dir)
+    evaluator.consume(records)
+    for key,value in sorted(evaluator.metrics().items()):
+        print(key+':',value)
@@ -0,0 +1,186 @@
+from __future__ import print_function
+import os
+'''
+In-memory API to the solution evaluator of compute_performance_summary.py, for scoring many
+candidate solutions from Python (e.g. in the tuning loop of a solver) without going through
+the filesystem:
+    instance=read_instance('public_instances/0o100t100s1p100')
+    solution=read_solution('solutions/0o100t100s1p100')
+    result=evaluate(instance,solution)
+    result.feasible, result.total_cost, result.violations, result.order_performance, ...
+evaluate takes an already parsed instance (an Instance) and solution: either a
+SolutionArrays (see solution_arrays.py), or the (assignment_sol, order_sol, courier_sol)
+frames of read_solution_information. It prints nothing, and only writes files when asked to
+(with an output directory, or the write methods of the result): the files are the same as
+those produced by compute_performance_summary.py.
+Importing this module is cheap: pandas, numpy and the evaluator itself are only imported
+the first time an instance or solution is read or evaluated.
+'''
+
+class Instance(object):
+    # a parsed instance: the values returned by read_instance_information, as attributes
+    def __init__(self,orders,restaurants,couriers,instanceparams,locations,meters_per_minute,\
+                 pickup_service_minutes,dropoff_service_minutes,target_click_to_door,\
+                 pay_per_order,guaranteed_pay_per_hour):
+        self.orders=orders
+        self.restaurants=restaurants
+        self.couriers=couriers
+        self.instanceparams=instanceparams
+        self.locations=locations
+        self.meters_per_minute=meters_per_minute
+        self.pickup_service_minutes=pickup_service_minutes
+        self.dropoff_service_minutes=dropoff_service_minutes
+        self.target_click_to_door=target_click_to_door
+        self.pay_per_order=pay_per_order
+        self.guaranteed_pay_per_hour=guaranteed_pay_per_hour
+        self._location_index=None
+
+    @property
+    def location_index(self):
+        # dense location index of location_index.py, built once and reused by every evaluation
+        if self._location_index is None:
+            from location_index import LocationIndex
+            self._location_index=LocationIndex.from_instance(self.orders,self.restaurants,self.couriers)
+        return self._location_index
+
+def read_instance(instance_dir,cache_instance=False):
+    # Instance from the files of an instance directory (through the compiled cache of
+    # instance_cache.py if cache_instance, which also holds its location index)
+    if cache_instance:
+        from instance_cache import read_cached_instance
+        information,location_index=read_cached_instance(instance_dir)
+        instance=Instance(*information)
+        instance._location_index=location_index
+        return instance
+    from compute_performance_summary import read_instance_information
+    return Instance(*read_instance_information(instance_dir))
+
+def read_solution(input_dir,stream_solution=False):
+    # solution from the files of a solution directory: a SolutionArrays streamed from the
+    # files if stream_solution, otherwise the frames of read_solution_information
+    if stream_solution:
+        from solution_arrays import read_solution_arrays
+        return read_solution_arrays(input_dir)
+    from compute_performance_summary import read_solution_information
+    assignment_sol,order_sol,courier_sol,_=read_solution_information(input_dir,verbose=False)
+    return assignment_sol,order_sol,courier_sol
+
+class PerformanceResult(object):
+    # feasible: whether the solution passes every feasibility check
+    # violations: the violations of each feasibility check, by key (see feasibility_checks
+    #     in compute_performance_summary.py); empty lists for the checks that pass
+    # total_delivered, total_orders, total_cost, proportion_trueup: summary metrics
+    # order_performance, courier_performance: per-order and per-courier frames
+    # bundle_size: frame with the number of orders of each bundle
+    # stages: (stage, seconds, rows, peak_bytes) of each stage of the evaluation (see
+    #     stage_timer.py)
+    def __init__(self,feasible,violations,total_delivered,total_orders,total_cost,proportion_trueup,\
+                 order_performance,courier_performance,bundle_size,stages=None):
+        self.feasible=feasible
+        self.violations=violations
+        self.total_delivered=total_delivered
+        self.total_orders=total_orders
+        self.total_cost=total_cost
+        self.proportion_trueup=proportion_trueup
+        self.order_performance=order_performance
+        self.courier_performance=courier_performance
+        self.bundle_size=bundle_size
+        self.stages=stages if stages is not None else []
+
+    def metrics(self):
+        # summary metrics as a dict
+        return {'feasible':self.feasible,'total_delivered':self.total_delivered,'total_orders':self.total_orders,\
+                'total_cost':self.total_cost,'proportion_trueup':self.proportion_trueup}
+
+    def timing_table(self):
+        # the stages of the evaluation as a printable table
+        from stage_timer import timing_table
+        return timing_table(self.stages)
+
+    def as_tuple(self):
+        # the values returned by compute_performance_summary
+        return self.feasible,self.total_delivered,self.total_cost,self.proportion_trueup,\
+               self.order_performance,self.courier_performance
+
+    def write_feasibility_check(self,output_dir):
+        from compute_performance_summary import write_feasibility_check
+        feasibility_file=os.path.join(output_dir,'feasibility_check.txt')
+        write_feasibility_check(self.violations,feasibility_file)
+        return feasibility_file
+
+    def summary(self):
+        # the contents of solution_performance.txt (unrounded) as a dict
+        from compute_performance_summary import performance_summary_data
+        return performance_summary_data(self.total_delivered,self.total_orders,self.total_cost,\
+                                        self.proportion_trueup,self.order_performance,\
+                                        self.courier_performance,self.bundle_size)
+
+    def write_performance_summary(self,output_dir):
+        # solution_performance.txt and its machine-readable version solution_performance.json
+        from compute_performance_summary import write_performance_summary,write_performance_json
+        performance_file=os.path.join(output_dir,'solution_performance.txt')
+        performance=(self.total_delivered,self.total_orders,self.total_cost,self.proportion_trueup,\
+                     self.order_performance,self.courier_performance,self.bundle_size)
+        write_performance_summary(performance_file,*performance)
+        write_performance_json(os.path.join(output_dir,'solution_performance.json'),*performance)
+        return performance_file
+
+    def write_performance_frames(self,output_dir):
+        # order_performance.parquet and courier_performance.parquet (requires pyarrow)
+        from compute_performance_summary import write_performance_frames
+        write_performance_frames(output_dir,self.order_performance,self.courier_performance)
+
+    def write(self,output_dir):
+        # the files of compute_performance_summary.py: the performance summary is only
+        # written for feasible solutions
+        self.write_feasibility_check(output_dir)
+        if self.feasible:
+            self.write_performance_summary(output_dir)
+
+def evaluate(instance,solution,engine='vectorized',output_dir=None,timer=None,trace_memory=False):
+    # PerformanceResult of a solution (SolutionArrays or frames, see above) of an Instance,
+    # checked with the vectorized or the row-by-row (engine=rowwise) engine; the result is
+    # also written to output_dir if given. The stages of the evaluation are recorded by a
+    # StageTimer (see stage_timer.py), with their peak memory if trace_memory, or by the
+    # given timer (which may already hold earlier stages, e.g. reading the files)
+    from compute_performance_summary import check_feasibility_rowwise,compute_performance_metrics
+    from solution_arrays import SolutionArrays
+    from vectorized_feasibility import check_feasibility_arrays,check_feasibility_vectorized
+    from stage_timer import StageTimer
+    if engine not in ('vectorized','rowwise'):
+        raise ValueError('unknown feasibility engine: {0} (expected vectorized or rowwise)'.format(engine))
+    own_timer=timer is None
+    timer=timer or StageTimer(trace_memory)
+    i=instance
+    if engine=='vectorized':
+        location_index=i.location_index
+        timer('location_index')
+    if isinstance(solution,SolutionArrays):
+        if engine!='vectorized':
+            raise ValueError('a streamed solution can only be checked by the vectorized engine')
+        checks,tallies=check_feasibility_arrays(i.orders,i.couriers,location_index,i.meters_per_minute,\
+                                                i.pickup_service_minutes,i.dropoff_service_minutes,solution,timer)
+        order_sol=solution.order_frame()
+    else:
+        assignment_sol,order_sol,courier_sol=solution[:3]
+        if engine=='vectorized':
+            checks,tallies=check_feasibility_vectorized(i.orders,i.couriers,location_index,i.meters_per_minute,\
+                                                        i.pickup_service_minutes,i.dropoff_service_minutes,\
+                                                        assignment_sol,order_sol,courier_sol,timer)
+        else:
+            checks,tallies=check_feasibility_rowwise(i.orders,i.couriers,i.locations,i.meters_per_minute,\
+                                                     i.pickup_service_minutes,i.dropoff_service_minutes,\
+                                                     assignment_sol,order_sol,courier_sol,timer)
+    feasible=not any(checks.values())
+    total_delivered,total_cost,proportion_trueup,order_performance,courier_performance,bundle_size=\
+        compute_performance_metrics(i.orders,i.couriers,order_sol,tallies,i.target_click_to_door,\
+                                    i.pay_per_order,i.guaranteed_pay_per_hour)
+    timer('metrics',len(order_performance))
+    result=PerformanceResult(feasible,checks,total_delivered,len(i.orders),total_cost,proportion_trueup,\
+                             order_performance,courier_performance,bundle_size,timer.stages)
+    if output_dir:
+        result.write(output_dir)
+        timer('write')
+    if own_timer:
+        timer.stop()
+    return result
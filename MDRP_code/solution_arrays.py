@@ -0,0 +1,226 @@
+from __future__ import print_function
+import os
+import array
+import itertools
+import numpy as np
+import pandas as pd
+'''
+Compact, columnar representation of a solution (SolutionArrays) and a streaming reader that
+builds it straight from solution_info_assignments.txt, solution_info_orders.txt and
+solution_info_couriers.txt.
+All ids (orders, restaurants, couriers) are interned into integer codes, shared by the three
+files; times of assignments and courier moves are int32, bundles are stored as one flat array
+of order codes with offsets, and courier moves as flat arrays with per-courier offsets.
+The files are read in chunks of lines into typed buffers, so memory stays bounded by the
+size of those arrays: no Python object is kept per assignment, order or move.
+solution_arrays_from_frames builds the same representation from the frames returned by
+read_solution_information in compute_performance_summary.py.
+'''
+
+# number of lines parsed at a time by the streaming reader
+default_chunk_lines=1<<16
+
+def buffer_array(buffer,dtype):
+    # numpy array (sharing memory) from an array.array buffer
+    return np.frombuffer(buffer,dtype=dtype) if len(buffer) else np.zeros(0,dtype=dtype)
+
+class SolutionArrays(object):
+    # ids: object array of interned ids, codes are positions in it (-1 stands for none)
+    # assignments, in file order: assignment_time, pickup_time (int32), assignment_courier
+    #     (code), and their bundles: orders bundle_orders[bundle_offsets[i]:bundle_offsets[i+1]]
+    # orders delivered, in file order: order (code), order_placement_time, order_ready_time,
+    #     order_pickup_time, order_dropoff_time (int64, or float64 if any value is not an
+    #     integer or is missing, as pandas would parse them) and order_courier (code)
+    # courier moves: couriers (codes, in order of first appearance) and the moves of courier
+    #     c in move_offsets[c]:move_offsets[c+1] of departure_time (int32), origin and
+    #     destination (codes; origin 0 in the file stands for the courier's on-location)
+    def __init__(self,ids,assignment_time,pickup_time,assignment_courier,bundle_offsets,bundle_orders,\
+                 order,order_placement_time,order_ready_time,order_pickup_time,order_dropoff_time,order_courier,\
+                 couriers,move_offsets,departure_time,origin,destination):
+        self.ids=ids
+        self.assignment_time=assignment_time
+        self.pickup_time=pickup_time
+        self.assignment_courier=assignment_courier
+        self.bundle_offsets=bundle_offsets
+        self.bundle_orders=bundle_orders
+        self.order=order
+        self.order_placement_time=order_placement_time
+        self.order_ready_time=order_ready_time
+        self.order_pickup_time=order_pickup_time
+        self.order_dropoff_time=order_dropoff_time
+        self.order_courier=order_courier
+        self.couriers=couriers
+        self.move_offsets=move_offsets
+        self.departure_time=departure_time
+        self.origin=origin
+        self.destination=destination
+
+    def codes(self,labels):
+        # codes of the given ids (-1 for ids that do not appear in the solution)
+        return pd.Index(self.ids).get_indexer(labels)
+
+    def bundle(self,i):
+        # ids of the orders in the bundle of assignment i
+        return self.ids[self.bundle_orders[self.bundle_offsets[i]:self.bundle_offsets[i+1]]].tolist()
+
+    def assignment_row(self,i):
+        # assignment i as a row of the assignment frame of read_solution_information
+        return pd.Series([int(self.assignment_time[i]),int(self.pickup_time[i]),\
+                          self.ids[self.assignment_courier[i]],self.bundle(i)],\
+                         index=['assignment_time','pickup_time','courier','bundle'],name=i,dtype=object)
+
+    def order_frame(self):
+        # the order frame of read_solution_information (without repeated header lines)
+        ids=np.append(self.ids,np.nan)
+        order_sol=pd.DataFrame({'placement_time':self.order_placement_time,'ready_time':self.order_ready_time,\
+                                'pickup_time':self.order_pickup_time,'dropoff_time':self.order_dropoff_time,\
+                                'courier':ids[self.order_courier]},\
+                               index=pd.Index(self.ids[self.order],name='order'))
+        return order_sol
+
+class IdInterner(object):
+    # assigns consecutive integer codes to ids, in order of first appearance
+    def __init__(self):
+        self.codes={}
+
+    def __call__(self,label):
+        return self.codes.setdefault(label,len(self.codes))
+
+    def ids(self):
+        ids=np.empty(len(self.codes),dtype=object)
+        ids[list(self.codes.values())]=list(self.codes.keys())
+        return ids
+
+def read_chunks(f,chunk_lines):
+    # lists of at most chunk_lines lines from a file
+    while True:
+        lines=list(itertools.islice(f,chunk_lines))
+        if not lines:
+            return
+        yield lines
+
+def read_assignment_arrays(input_dir,intern,chunk_lines=default_chunk_lines):
+    assignment_time=array.array('i')
+    pickup_time=array.array('i')
+    assignment_courier=array.array('i')
+    bundle_sizes=array.array('q')
+    bundle_orders=array.array('i')
+    with open(os.path.join(input_dir,'solution_info_assignments.txt'),'r') as f:
+        next(f,None) # header
+        for lines in read_chunks(f,chunk_lines):
+            for line in lines:
+                a=line.split()
+                if not a:
+                    continue
+                assignment_time.append(int(float(a[0])))
+                pickup_time.append(int(float(a[1])))
+                assignment_courier.append(intern(a[2]))
+                bundle_orders.extend(intern(o) for o in a[3:])
+                bundle_sizes.append(len(a)-3)
+    bundle_offsets=np.zeros(len(bundle_sizes)+1,dtype=np.int64)
+    np.cumsum(buffer_array(bundle_sizes,np.int64),out=bundle_offsets[1:])
+    return buffer_array(assignment_time,np.int32),buffer_array(pickup_time,np.int32),\
+           buffer_array(assignment_courier,np.int32),bundle_offsets,buffer_array(bundle_orders,np.int32)
+
+def read_order_arrays(input_dir,intern,chunk_lines=default_chunk_lines):
+    time_columns=['placement_time','ready_time','pickup_time','dropoff_time']
+    order=array.array('i')
+    order_courier=array.array('i')
+    times={c:array.array('d') for c in time_columns}
+    integral={c:True for c in time_columns} # whether all values are integers
+    with open(os.path.join(input_dir,'solution_info_orders.txt'),'r') as f:
+        header=next(f,'').split()
+        column={c:i for i,c in enumerate(header)}
+        field=lambda o,c:o[column[c]] if column[c]<len(o) else ''
+        for lines in read_chunks(f,chunk_lines):
+            for line in lines:
+                o=line.split()
+                d=field(o,'courier')
+                if not o or d=='courier': # blank or repeated header line
+                    continue
+                order.append(intern(o[column['order']]))
+                order_courier.append(intern(d) if d else -1)
+                for c in time_columns:
+                    value=field(o,c)
+                    try:
+                        times[c].append(float(value))
+                    except ValueError:
+                        times[c].append(np.nan)
+                        integral[c]=False
+                    else:
+                        integral[c]=integral[c] and value.lstrip('+-').isdigit()
+    times={c:buffer_array(times[c],np.float64) for c in time_columns}
+    times={c:times[c].astype(np.int64) if integral[c] else times[c] for c in time_columns}
+    return buffer_array(order,np.int32),times['placement_time'],times['ready_time'],\
+           times['pickup_time'],times['dropoff_time'],buffer_array(order_courier,np.int32)
+
+def read_move_arrays(input_dir,intern,chunk_lines=default_chunk_lines):
+    # moves of a courier may come in several blocks (one per assignment), possibly
+    # interleaved with those of other couriers: they are gathered per courier, in file order
+    move_courier=array.array('i')
+    departure_time=array.array('i')
+    origin=array.array('i')
+    destination=array.array('i')
+    with open(os.path.join(input_dir,'solution_info_couriers.txt'),'r') as f:
+        for lines in read_chunks(f,chunk_lines):
+            for line in lines:
+                a=line.split()
+                if not a:
+                    continue
+                try:
+                    t=int(float(a[1]))
+                except ValueError:
+                    continue # header line
+                d=intern(a[0])
+                move_courier.append(d)
+                departure_time.append(t)
+                origin.append(intern(a[2]) if a[2]!='0' else d)
+                destination.append(intern(a[3]))
+    move_courier=buffer_array(move_courier,np.int32)
+    couriers,first_appearance,move_rank=np.unique(move_courier,return_index=True,return_inverse=True)
+    # rank couriers by first appearance, and sort moves (stably) by the rank of their courier
+    order_of_appearance=np.argsort(first_appearance)
+    couriers=couriers[order_of_appearance]
+    rank=np.empty(len(couriers),dtype=np.int64)
+    rank[order_of_appearance]=np.arange(len(couriers))
+    move_rank=rank[move_rank]
+    moves=np.argsort(move_rank,kind='stable')
+    move_offsets=np.zeros(len(couriers)+1,dtype=np.int64)
+    np.cumsum(np.bincount(move_rank,minlength=len(couriers)),out=move_offsets[1:])
+    return couriers,move_offsets,buffer_array(departure_time,np.int32)[moves],\
+           buffer_array(origin,np.int32)[moves],buffer_array(destination,np.int32)[moves]
+
+def read_solution_arrays(input_dir,chunk_lines=default_chunk_lines):
+    # stream the three solution files into a SolutionArrays
+    intern=IdInterner()
+    assignments=read_assignment_arrays(input_dir,intern,chunk_lines)
+    orders=read_order_arrays(input_dir,intern,chunk_lines)
+    moves=read_move_arrays(input_dir,intern,chunk_lines)
+    return SolutionArrays(intern.ids(),*(assignments+orders+moves))
+
+def solution_arrays_from_frames(assignment_sol,order_sol,courier_sol):
+    # SolutionArrays of the solution returned by read_solution_information
+    intern=IdInterner()
+    bundle_sizes=np.array([len(b) for b in assignment_sol.bundle],dtype=np.int64)
+    bundle_offsets=np.zeros(len(bundle_sizes)+1,dtype=np.int64)
+    np.cumsum(bundle_sizes,out=bundle_offsets[1:])
+    assignment_courier=np.array([intern(d) for d in assignment_sol.courier],dtype=np.int32)
+    bundle_orders=np.array([intern(o) for b in assignment_sol.bundle for o in b],dtype=np.int32)
+
+    order_sol=order_sol[order_sol.courier!='courier']
+    order=np.array([intern(o) for o in order_sol.index],dtype=np.int32)
+    order_courier=np.array([intern(d) if isinstance(d,str) else -1 for d in order_sol.courier],dtype=np.int32)
+
+    couriers=np.array([intern(d) for d in courier_sol],dtype=np.int32)
+    move_offsets=np.zeros(len(couriers)+1,dtype=np.int64)
+    np.cumsum([len(s) for s in courier_sol.values()],out=move_offsets[1:])
+    moves=[a for s in courier_sol.values() for a in s]
+    departure_time=np.array([a[0] for a in moves],dtype=np.int32)
+    origin=np.array([intern(a[1]) for a in moves],dtype=np.int32)
+    destination=np.array([intern(a[2]) for a in moves],dtype=np.int32)
+    return SolutionArrays(intern.ids(),assignment_sol.assignment_time.to_numpy(dtype=np.int32),\
+                          assignment_sol.pickup_time.to_numpy(dtype=np.int32),assignment_courier,\
+                          bundle_offsets,bundle_orders,order,\
+                          order_sol.placement_time.to_numpy(),order_sol.ready_time.to_numpy(),\
+                          order_sol.pickup_time.to_numpy(),order_sol.dropoff_time.to_numpy(),order_courier,\
+                          couriers,move_offsets,departure_time,origin,destination)
@@ -0,0 +1,254 @@
+from __future__ import print_function
+import math
+import numpy as np
+import pandas as pd
+from location_index import LocationIndex
+'''
+Grid index over points of an instance (restaurants, orders, couriers, or all locations) for
+k-nearest and radius queries on the x/y meter coordinates, without comparing every pair of
+points. Points are bucketed in square cells and stored sorted by cell, with the offsets of
+the occupied cells only (as courier timelines are in courier_timeline.py), so the points of
+any set of cells are gathered with a few array operations. The cell size follows the density
+of the points where they are, not over their bounding box: instances are clustered around
+restaurants, and cells sized for a uniform density hold most points in a few cells.
+Queries are batched: each query point looks at the rings of cells around its own, one ring
+more at a time, and the (query, point) pairs of all queries are ranked at once. rings() walks
+the rings around a single point lazily instead, for searches that stop at a bound of their
+own (as the courier search of greedy_dispatcher.py).
+Distances are euclidean, in meters: "within N minutes" of a location, with the travel times
+of traveltime() in compute_performance_summary.py, is within N*meters_per_minute meters.
+Example, the couriers within 10 minutes of each restaurant and the 5 restaurants nearest to
+each order:
+    index=LocationIndex.from_instance(orders,restaurants,couriers)
+    couriers_index=SpatialIndex.from_location_index(index,'couriers')
+    offsets,positions,distances=couriers_index.query_radius(restaurants.x,restaurants.y,10*meters_per_minute)
+    distances,positions=SpatialIndex.from_location_index(index,'restaurants').query_nearest(orders.x,orders.y,5)
+'''
+
+def density_cell_size(x,y,points_per_cell=4):
+    # side of square cells such that the cell of a point holds about points_per_cell points
+    # (on average over the points): starting from a uniform density over the bounding box,
+    # cells are shrunk as long as that splits the clusters (and not coincident points)
+    n=len(x)
+    if n==0:
+        return 1.0
+    x0,y0=x.min(),y.min()
+    size=math.sqrt(max(x.max()-x0,1.0)*max(y.max()-y0,1.0)/max(n/float(points_per_cell),1.0))
+    occupied=None
+    for _ in range(10):
+        i=np.floor((x-x0)/size).astype(np.int64)
+        j=np.floor((y-y0)/size).astype(np.int64)
+        _,counts=np.unique(i*(j.max()+1)+j,return_counts=True)
+        if occupied is not None and len(counts)<1.1*occupied:
+            return previous # smaller cells would not split the points any further
+        occupancy=(counts*counts).sum()/float(n) # points in the cell of a point, on average
+        if occupancy<=2*points_per_cell or size<=1.0:
+            break
+        occupied,previous=len(counts),size
+        size=max(size*math.sqrt(points_per_cell/occupancy),1.0)
+    return size
+
+def ring_offsets(r):
+    # (di, dj) offsets of the cells r cells away (in both directions) from a cell
+    if r==0:
+        return np.zeros(1,dtype=np.int64),np.zeros(1,dtype=np.int64)
+    side=np.arange(-r,r+1)
+    inner=np.arange(-r+1,r)
+    di=np.concatenate([side,side,np.full(len(inner),-r),np.full(len(inner),r)])
+    dj=np.concatenate([np.full(len(side),-r),np.full(len(side),r),inner,inner])
+    return di,dj
+
+class SpatialIndex(object):
+    def __init__(self,x,y,ids=None,cell_size=None,points_per_cell=4):
+        # x,y: coordinates (in meters) of the points, which queries refer to by position
+        # ids: optional ids of the points
+        # cell_size: side of the cells, in meters (by default, see density_cell_size)
+        self.x=np.ascontiguousarray(x,dtype=np.float64)
+        self.y=np.ascontiguousarray(y,dtype=np.float64)
+        self.ids=pd.Index(ids) if ids is not None else None
+        n=len(self.x)
+        self.x0,self.y0=(self.x.min(),self.y.min()) if n else (0.0,0.0)
+        width,height=(self.x.max()-self.x0,self.y.max()-self.y0) if n else (0.0,0.0)
+        if cell_size is None:
+            cell_size=density_cell_size(self.x,self.y,points_per_cell)
+        self.cell_size=max(float(cell_size),1.0)
+        self.shape=(int(width//self.cell_size)+1,int(height//self.cell_size)+1)
+        i,j=self.cells(self.x,self.y)
+        cell=i*self.shape[1]+j
+        self.points=np.argsort(cell,kind='stable') # positions of the points, sorted by cell
+        # occupied cells (keys i*shape[1]+j, sorted) and the offsets of their points
+        self.cell_keys,first=np.unique(cell[self.points],return_index=True)
+        self.cell_offsets=np.append(first,n)
+        self.cell_slices=None # (first, last) point of each occupied cell by key, for rings()
+
+    @classmethod
+    def from_location_index(cls,location_index,group=None,cell_size=None):
+        # the points of a LocationIndex, or of one of its groups ('orders', 'restaurants',
+        # 'couriers'; see LocationIndex.from_instance)
+        positions=location_index.groups[group] if group else slice(None)
+        return cls(location_index.x[positions],location_index.y[positions],location_index.ids[positions],cell_size)
+
+    @classmethod
+    def from_locations(cls,locations,cell_size=None):
+        # from the locations frame built by read_instance_information
+        return cls.from_location_index(LocationIndex.from_locations(locations),cell_size=cell_size)
+
+    def __len__(self):
+        return len(self.x)
+
+    def cells(self,x,y):
+        # grid coordinates of the cells of points (possibly outside the grid)
+        return (np.floor((np.asarray(x,dtype=np.float64)-self.x0)/self.cell_size).astype(np.int64),\
+                np.floor((np.asarray(y,dtype=np.float64)-self.y0)/self.cell_size).astype(np.int64))
+
+    def last_ring(self,i,j):
+        # rings of cells away from cells (i, j) beyond which there is no point
+        return np.maximum(np.maximum(i,self.shape[0]-1-i),np.maximum(j,self.shape[1]-1-j))
+
+    def points_in_cells(self,query,cell_i,cell_j):
+        # (query, point) pairs for the points in the cell (cell_i, cell_j) of each query
+        inside=(cell_i>=0)&(cell_i<self.shape[0])&(cell_j>=0)&(cell_j<self.shape[1])
+        query=query[inside]
+        key=(cell_i*self.shape[1]+cell_j)[inside]
+        k=np.minimum(np.searchsorted(self.cell_keys,key),max(len(self.cell_keys)-1,0))
+        occupied=self.cell_keys[k]==key if len(self.cell_keys) else np.zeros(len(key),dtype=bool)
+        query,k=query[occupied],k[occupied]
+        start=self.cell_offsets[k]
+        counts=self.cell_offsets[k+1]-start
+        first=np.cumsum(counts)-counts
+        entry=np.repeat(start-first,counts)+np.arange(counts.sum())
+        return np.repeat(query,counts),self.points[entry]
+
+    def cell_pairs(self,i,j,reach):
+        # (query, point) pairs for the points in the cells at most reach cells away (in both
+        # directions) from the cell (i, j) of each query; queries are positions in i and j
+        offsets=np.arange(-reach,reach+1)
+        cell_i=i[:,None]+np.repeat(offsets,len(offsets))[None,:]
+        cell_j=j[:,None]+np.tile(offsets,len(offsets))[None,:]
+        query=np.broadcast_to(np.arange(len(i))[:,None],cell_i.shape)
+        return self.points_in_cells(query.ravel(),cell_i.ravel(),cell_j.ravel())
+
+    def ring_pairs(self,i,j,r):
+        # (query, point) pairs for the points in the cells exactly r cells away from the
+        # cell (i, j) of each query
+        di,dj=ring_offsets(r)
+        cell_i=i[:,None]+di[None,:]
+        cell_j=j[:,None]+dj[None,:]
+        query=np.broadcast_to(np.arange(len(i))[:,None],cell_i.shape)
+        return self.points_in_cells(query.ravel(),cell_i.ravel(),cell_j.ravel())
+
+    def ranked_pairs(self,x,y,i,j,reach,radius=np.inf):
+        # cell_pairs within radius meters and their distances, sorted by query, distance
+        # and point
+        query,point=self.cell_pairs(i,j,reach)
+        distance=np.hypot(self.x[point]-x[query],self.y[point]-y[query])
+        if radius<np.inf:
+            within=distance<=radius
+            query,point,distance=query[within],point[within],distance[within]
+        order=np.lexsort((point,distance,query))
+        return query[order],point[order],distance[order]
+
+    def query_nearest(self,x,y,k=1):
+        # the k nearest points to each query point (x, y arrays): arrays of shape
+        # (queries, k) of their distances and positions, nearest first (ties by position),
+        # padded with inf and -1 if there are fewer than k points
+        x=np.atleast_1d(np.asarray(x,dtype=np.float64))
+        y=np.atleast_1d(np.asarray(y,dtype=np.float64))
+        distances=np.full((len(x),k),np.inf)
+        positions=np.full((len(x),k),-1,dtype=np.int64)
+        k_found=min(k,len(self))
+        i,j=self.cells(x,y)
+        last_reach=self.last_ring(i,j)
+        todo=np.arange(len(x)) if k_found else np.arange(0)
+        reach=0
+        while len(todo):
+            # the points of the next ring, ranked together with the k nearest found so far
+            query,point=self.ring_pairs(i[todo],j[todo],reach)
+            found=positions[todo,:k_found]
+            known=found>=0
+            query=np.concatenate([np.nonzero(known)[0],query])
+            point=np.concatenate([found[known],point])
+            distance=np.hypot(self.x[point]-x[todo[query]],self.y[point]-y[todo[query]])
+            order=np.lexsort((point,distance,query))
+            query,point,distance=query[order],point[order],distance[order]
+            rank=np.arange(len(query))-np.searchsorted(query,np.arange(len(todo)))[query]
+            keep=rank<k_found
+            distances[todo[query[keep]],rank[keep]]=distance[keep]
+            positions[todo[query[keep]],rank[keep]]=point[keep]
+            # every point within reach*cell_size meters of a query is in the rings searched
+            done=(distances[todo,k_found-1]<=reach*self.cell_size)|(last_reach[todo]<=reach)
+            todo=todo[~done]
+            reach+=1
+        return distances,positions
+
+    def query_radius(self,x,y,radius):
+        # the points within radius meters of each query point (x, y arrays), nearest first
+        # (ties by position), in compressed form: the points of query q are
+        # positions[offsets[q]:offsets[q+1]], at distances[offsets[q]:offsets[q+1]]
+        x=np.atleast_1d(np.asarray(x,dtype=np.float64))
+        y=np.atleast_1d(np.asarray(y,dtype=np.float64))
+        i,j=self.cells(x,y)
+        query,point,distance=self.ranked_pairs(x,y,i,j,int(math.ceil(radius/self.cell_size)),radius)
+        return np.searchsorted(query,np.arange(len(x)+1)),point,distance
+
+    def count_radius(self,x,y,radius):
+        # number of points within radius meters of each query point (as query_radius, but
+        # without ranking the points)
+        x=np.atleast_1d(np.asarray(x,dtype=np.float64))
+        y=np.atleast_1d(np.asarray(y,dtype=np.float64))
+        i,j=self.cells(x,y)
+        query,point=self.cell_pairs(i,j,int(math.ceil(radius/self.cell_size)))
+        within=np.hypot(self.x[point]-x[query],self.y[point]-y[query])<=radius
+        return np.bincount(query[within],minlength=len(x))
+
+    def rings(self,x,y):
+        # (ring, positions) for the nonempty rings of cells around a single point (x, y),
+        # nearest first, walked outward lazily (so the caller can stop as soon as farther
+        # points cannot do better): ring r holds the cells r cells away, whose points are at
+        # least (r-1)*cell_size meters away from (x, y). Rings are walked cell by cell while
+        # the square they cover has fewer cells than the grid has occupied ones; past that,
+        # the occupied cells left are sorted by ring at once
+        if self.cell_slices is None:
+            self.points_list=self.points.tolist()
+            self.cell_slices=dict(zip(self.cell_keys.tolist(),\
+                                      zip(self.cell_offsets[:-1].tolist(),self.cell_offsets[1:].tolist())))
+        if not self.cell_slices:
+            return
+        ci=int(math.floor((x-self.x0)/self.cell_size))
+        cj=int(math.floor((y-self.y0)/self.cell_size))
+        rows,columns=self.shape
+        cells=self.cell_slices
+        points=self.points_list
+        last=max(ci,rows-1-ci,cj,columns-1-cj,0)
+        r=0
+        while r<=last and (2*r+1)**2<=len(cells):
+            if r==0:
+                ring=[(ci,cj)]
+            else:
+                ring=[(i,j) for i in range(ci-r,ci+r+1) for j in (cj-r,cj+r)]\
+                    +[(i,j) for j in range(cj-r+1,cj+r) for i in (ci-r,ci+r)]
+            positions=[]
+            for i,j in ring:
+                if 0<=i<rows and 0<=j<columns:
+                    cell=cells.get(i*columns+j)
+                    if cell:
+                        positions.extend(points[cell[0]:cell[1]])
+            if positions:
+                yield r,positions
+            r+=1
+        if r>last:
+            return
+        cell_ring=np.maximum(np.abs(self.cell_keys//columns-ci),np.abs(self.cell_keys%columns-cj))
+        farther=np.flatnonzero(cell_ring>=r)
+        farther=farther[np.argsort(cell_ring[farther],kind='stable')]
+        starts=self.cell_offsets[farther].tolist()
+        ends=self.cell_offsets[farther+1].tolist()
+        cell_ring=cell_ring[farther].tolist()
+        k=0
+        while k<len(farther):
+            r=cell_ring[k]
+            positions=[]
+            while k<len(farther) and cell_ring[k]==r:
+                positions.extend(points[starts[k]:ends[k]])
+                k+=1
+            yield r,positions
@@ -0,0 +1,54 @@
+from __future__ import print_function
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+'''
+Timing of the stages of an evaluation. A StageTimer is called with the name of each stage
+(and optionally the number of rows it processed) as soon as that stage is done: the
+feasibility engines take it as their stage callback (see vectorized_feasibility.py), and
+performance_evaluator.evaluate keeps the stages of every evaluation in its result. Each
+stage records the wall time since the previous stage and, optionally, the peak memory
+allocated during the stage as traced by tracemalloc (which includes numpy arrays, but slows
+pure Python code down: time and memory are best measured in separate runs).
+'''
+
+class StageTimer(object):
+    def __init__(self,trace_memory=False):
+        self.trace_memory=trace_memory
+        self.stages=[] # (stage, seconds, rows, peak_bytes) of each stage done
+        self.started_tracing=trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        self.start()
+
+    def start(self):
+        # the next stage starts now
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.last=time.perf_counter()
+
+    def __call__(self,name,rows=None):
+        seconds=time.perf_counter()-self.last
+        peak=tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        self.stages.append((name,seconds,rows,peak))
+        self.start()
+
+    def stop(self):
+        # stop tracing memory (if this timer started it)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing=False
+
+    def frame(self):
+        return pd.DataFrame(self.stages,columns=['stage','seconds','rows','peak_bytes'])
+
+def timing_table(stages):
+    # the stages (as in StageTimer.stages) as a printable table, with their total time
+    frame=pd.DataFrame(stages,columns=['stage','seconds','rows','peak_bytes'])
+    frame['share']=frame.seconds/frame.seconds.sum()
+    frame['peak_mb']=frame.pop('peak_bytes')/2.0**20
+    frame.loc[len(frame)]=['total',frame.seconds.sum(),np.nan,1.0,frame.peak_mb.max()]
+    frame['rows']=frame.rows.astype(float)
+    return frame.to_string(index=False,na_rep='',formatters={'seconds':'{0:.4f}'.format,'rows':'{0:.0f}'.format,\
+                                                             'share':'{0:.1%}'.format,'peak_mb':'{0:.1f}'.format})
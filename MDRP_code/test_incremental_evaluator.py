@@ -0,0 +1,103 @@
+from __future__ import print_function
+import os
+import numpy as np
+import pytest
+from compute_performance_summary import read_instance_tables
+from generate_instance import write_solution
+from greedy_dispatcher import dispatch
+from incremental_evaluator import Assignment,IncrementalEvaluator
+from performance_evaluator import read_instance,read_solution,evaluate
+'''
+Consistency test of the incremental evaluator against the full recomputation: on solutions
+of public instances built by greedy_dispatcher.py, seeded random deltas (removing an
+assignment, adding a removed one back, shifting an assignment in time, giving it to another
+courier) are applied one at a time, and after each one the violation counts and metrics of
+IncrementalEvaluator must be those of performance_evaluator.evaluate on its solution().
+Loaded with from_solution, the evaluator must also agree with the full evaluation of the
+files as loaded, on those solutions and on solutions made infeasible by retiming them
+(assignments before placement, pickups too early or after the off time, dropoffs out of
+sequence or away from the courier), whose order rows still agree with the assignments.
+'''
+
+instances_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','public_instances')
+instance_names=['0o100t100s1p100','9o50t100s2p100']
+steps=40
+
+def shifted(a,minutes):
+    # assignment a with its pickup, dropoffs and moves minutes later
+    return Assignment(a.assignment_time,a.pickup_time+minutes,a.courier,a.bundle,\
+                      [t+minutes for t in a.dropoff_times],[(m[0]+minutes,m[1],m[2]) for m in a.moves])
+
+def reassigned(a,courier):
+    # assignment a given to another courier, leaving from where the courier is (its
+    # on-location for a first move from the on-location of the previous courier)
+    return Assignment(a.assignment_time,a.pickup_time,courier,a.bundle,a.dropoff_times,\
+                      [(m[0],'0' if m[1]==a.courier else m[1],m[2]) for m in a.moves])
+
+def random_delta(evaluator,removed,rng):
+    # (removed ids, added Assignments) of a random delta
+    ids=sorted(evaluator.assignments)
+    kind=rng.randint(4)
+    if kind==1 and removed:
+        return [],[removed.pop(rng.randint(len(removed)))]
+    i=ids[rng.randint(len(ids))]
+    a=evaluator.assignments[i]
+    if kind==0 or kind==1:
+        removed.append(a)
+        return [i],[]
+    if kind==2:
+        return [i],[shifted(a,int(rng.randint(-10,11)))]
+    couriers=sorted(evaluator.on_time)
+    return [i],[reassigned(a,couriers[rng.randint(len(couriers))])]
+
+def retimed(assignments,order_rows,courier_moves,seed):
+    # the solution with assignment, pickup and dropoff times of random assignments moved
+    rng=np.random.RandomState(seed)
+    assignments=[list(a) for a in assignments]
+    order_rows=[list(row) for row in order_rows]
+    row_of=dict((row[0],row) for row in order_rows)
+    for i in rng.choice(len(assignments),10,replace=False):
+        a=assignments[i]
+        a[int(rng.randint(2))]+=int(rng.randint(-30,31))
+        row_of[a[3][int(rng.randint(len(a[3])))]][4]+=int(rng.randint(-10,11))
+    return [tuple(a) for a in assignments],[tuple(row) for row in order_rows],courier_moves
+
+def assert_consistent(evaluator,instance,solution=None):
+    # against the full evaluation of the evaluator's solution(), or of the given one
+    result=evaluate(instance,solution if solution is not None else evaluator.solution())
+    assert evaluator.violation_counts()=={key:len(v) for key,v in result.violations.items()}
+    metrics=evaluator.metrics()
+    assert metrics['feasible']==result.feasible
+    assert metrics['total_delivered']==result.total_delivered
+    assert metrics['total_orders']==result.total_orders
+    assert metrics['total_cost']==pytest.approx(result.total_cost)
+    assert metrics['proportion_trueup']==pytest.approx(result.proportion_trueup)
+    assert metrics['click_to_door_overage']==pytest.approx(result.order_performance['click-to-door overage'].sum())
+
+@pytest.mark.parametrize('name',instance_names)
+@pytest.mark.parametrize('seed',[0,1])
+def test_consistent_with_full_evaluation(tmp_path,name,seed):
+    instance_dir=os.path.join(instances_dir,name)
+    write_solution(str(tmp_path),*dispatch(*read_instance_tables(instance_dir)))
+    instance=read_instance(instance_dir)
+    evaluator=IncrementalEvaluator.from_solution(instance,*read_solution(str(tmp_path)))
+    assert_consistent(evaluator,instance)
+    rng=np.random.RandomState(seed)
+    removed=[]
+    for _ in range(steps):
+        evaluator.apply(*random_delta(evaluator,removed,rng))
+        assert_consistent(evaluator,instance)
+
+@pytest.mark.parametrize('name',instance_names)
+@pytest.mark.parametrize('seed',[None,0,1])
+def test_loaded_solution_as_full_evaluation(tmp_path,name,seed):
+    instance_dir=os.path.join(instances_dir,name)
+    solution=dispatch(*read_instance_tables(instance_dir))
+    if seed is not None:
+        solution=retimed(*solution,seed=seed)
+    write_solution(str(tmp_path),*solution)
+    instance=read_instance(instance_dir)
+    loaded=read_solution(str(tmp_path))
+    evaluator=IncrementalEvaluator.from_solution(instance,*loaded)
+    assert evaluator.feasible==(seed is None)
+    assert_consistent(evaluator,instance,loaded)
@@ -0,0 +1,57 @@
+from __future__ import print_function
+import os
+import numpy as np
+import pytest
+from compute_performance_summary import read_instance_tables
+from generate_instance import write_solution
+from greedy_dispatcher import dispatch
+from online_evaluator import OnlineEvaluator,records_from_solution
+from performance_evaluator import read_instance,read_solution,evaluate
+'''
+Regression test of the online evaluator against the full evaluation: on solutions of public
+instances built by greedy_dispatcher.py, corrupted with orders listed twice in a row in their
+bundle, orders added to a second bundle, dropoffs moved earlier and orders reported with
+another courier (the moves are left alone, so that every courier timeline stays sorted), the
+violation counts and metrics of OnlineEvaluator, fed the records of the solution files,
+must be those of performance_evaluator.evaluate with both engines.
+'''
+
+instances_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','public_instances')
+instance_names=['0o100t100s1p100','9o50t100s2p100']
+
+def corrupt(assignments,order_rows,courier_moves,seed):
+    rng=np.random.RandomState(seed)
+    assignments=[(a,p,d,list(b)) for a,p,d,b in assignments]
+    order_rows=[list(row) for row in order_rows]
+    for i in rng.choice(len(assignments),3,replace=False):
+        bundle=assignments[i][3]
+        k=rng.randint(len(bundle))
+        bundle.insert(k,bundle[k])
+    for _ in range(3):
+        i,j=rng.choice(len(assignments),2,replace=False)
+        assignments[j][3].insert(rng.randint(len(assignments[j][3])+1),assignments[i][3][0])
+    for k in rng.choice(len(order_rows),5,replace=False):
+        order_rows[k][4]-=int(rng.randint(1,20))
+    for k in rng.choice(len(order_rows),3,replace=False):
+        order_rows[k][5]=order_rows[rng.randint(len(order_rows))][5]
+    return assignments,order_rows,courier_moves
+
+@pytest.mark.parametrize('name',instance_names)
+@pytest.mark.parametrize('seed',[None,0,1])
+def test_same_counts_as_full_evaluation(tmp_path,name,seed):
+    instance_dir=os.path.join(instances_dir,name)
+    solution=dispatch(*read_instance_tables(instance_dir))
+    if seed is not None:
+        solution=corrupt(*solution,seed=seed)
+    write_solution(str(tmp_path),*solution)
+    instance=read_instance(instance_dir)
+    evaluator=OnlineEvaluator(instance).consume(records_from_solution(str(tmp_path)))
+    metrics=evaluator.metrics()
+    for engine in ['vectorized','rowwise']:
+        result=evaluate(instance,read_solution(str(tmp_path)),engine)
+        assert evaluator.violation_counts()=={key:len(v) for key,v in result.violations.items()}
+        assert metrics['feasible']==result.feasible==(seed is None)
+        assert metrics['total_delivered']==result.total_delivered
+        assert metrics['total_cost']==pytest.approx(result.total_cost)
+        assert metrics['proportion_trueup']==pytest.approx(result.proportion_trueup)
+        assert metrics['click_to_door_overage']==pytest.approx(result.order_performance['click-to-door overage'].sum())
@@ -0,0 +1,70 @@
+from __future__ import print_function
+import os
+import numpy as np
+import pytest
+from compute_performance_summary import read_instance_tables,orders_in_several_assignments
+from generate_instance import scale_instance,build_feasible_solution,write_solution
+from performance_evaluator import read_instance,read_solution,evaluate
+'''
+Regression test of the at-most-one-assignment check: the violations found from
+index_assignments_by_order must be those of the original scan of every bundle for every
+order of the solution, in the same order, on feasible solutions and on solutions corrupted
+with orders in several bundles, orders listed twice in a bundle and orders reported twice.
+The row-wise engine is run in full on the solutions without repeated order rows (its
+dropoff sequencing check, as in the original evaluator, cannot look those up); the
+vectorized engine on all of them.
+'''
+
+instances_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','public_instances')
+instance_names=['0o100t100s1p100','9o50t100s2p100']
+
+def reference_violations(assignment_sol,order_sol):
+    # the scan the check used to do: orders (once per line of the order file) against
+    # every bundle
+    bundles_per_order={}
+    for o in order_sol.index:
+        for b in assignment_sol.bundle:
+            if o in b:
+                if o in bundles_per_order:
+                    bundles_per_order[o].append(b)
+                else:
+                    bundles_per_order[o]=[b]
+    return [o for o,l in bundles_per_order.items() if len(l)>1]
+
+def feasible_solution(instance_dir):
+    orders,restaurants,couriers,instanceparams=read_instance_tables(instance_dir)
+    orders,restaurants,couriers,order_copy,courier_copy=scale_instance(orders,restaurants,couriers,1)
+    return build_feasible_solution(orders,restaurants,couriers,instanceparams,order_copy,courier_copy)
+
+def corrupt(assignments,order_rows,courier_moves,seed,repeat_rows=True):
+    # orders added to a second bundle, orders listed twice in their bundle and (if
+    # repeat_rows) order rows repeated
+    rng=np.random.RandomState(seed)
+    assignments=[(a,p,d,list(b)) for a,p,d,b in assignments]
+    order_rows=list(order_rows)
+    for _ in range(5):
+        i,j=rng.choice(len(assignments),2,replace=False)
+        assignments[j][3].insert(rng.randint(len(assignments[j][3])+1),assignments[i][3][0])
+    for i in rng.choice(len(assignments),5,replace=False):
+        assignments[i][3].append(assignments[i][3][0])
+    for k in rng.choice(len(order_rows),5 if repeat_rows else 0,replace=False):
+        order_rows.insert(rng.randint(len(order_rows)+1),order_rows[k])
+    return assignments,order_rows,courier_moves
+
+@pytest.mark.parametrize('name',instance_names)
+@pytest.mark.parametrize('seed,repeat_rows',[(None,False),(0,False),(1,False),(0,True),(1,True),(2,True)])
+def test_same_violations_as_scan(tmp_path,name,seed,repeat_rows):
+    instance_dir=os.path.join(instances_dir,name)
+    solution=feasible_solution(instance_dir)
+    if seed is not None:
+        solution=corrupt(*solution,seed=seed,repeat_rows=repeat_rows)
+    write_solution(str(tmp_path),*solution)
+    instance=read_instance(instance_dir)
+    assignment_sol,order_sol,courier_sol=read_solution(str(tmp_path))
+    expected=reference_violations(assignment_sol,order_sol)
+    assert bool(expected)==(seed is not None)
+    assert orders_in_several_assignments(assignment_sol,order_sol)==expected
+    engines=['vectorized'] if repeat_rows else ['vectorized','rowwise']
+    for engine in engines:
+        result=evaluate(instance,(assignment_sol,order_sol,courier_sol),engine)
+        assert result.violations['orders_in_several_assignments']==expected
@@ -0,0 +1,184 @@
+from __future__ import print_function
+import numpy as np
+from location_index import LocationIndex
+from solution_arrays import solution_arrays_from_frames
+from courier_timeline import CourierTimelines
+'''
+Columnar version of the feasibility checks performed by compute_performance_summary.py.
+The checks work on a SolutionArrays (see solution_arrays.py): bundles are a flat array of
+(interned) order codes, with the assignment and the position in its bundle of each entry
+repeated out of the bundle offsets, courier moves are flat arrays, and every check is
+evaluated as a join (integer positions into the instance tables) followed by a mask. Courier
+timelines are kept in the compressed form of courier_timeline.py, so the pickup and dropoff
+location checks are each a single search over all events. Python objects are only built for
+the violations, which are reported exactly as the row-by-row checks report them.
+'''
+
+def code_positions(index,ids,codes):
+    # integer positions in an index of the ids with the given codes (ids[codes]); unknown
+    # ids raise a KeyError
+    positions=index.get_indexer(ids)[codes]
+    missing=positions<0
+    if missing.any():
+        raise KeyError(ids[codes[missing][0]])
+    return positions
+
+def locate_couriers(timelines,ids,event_couriers,event_times):
+    # CourierTimelines.locate, with couriers that have no timeline reported by id
+    try:
+        return timelines.locate(event_couriers,event_times)
+    except KeyError as e:
+        raise KeyError(ids[e.args[0]])
+
+def check_feasibility_vectorized(orders,couriers,locations,meters_per_minute,\
+                                 pickup_service_minutes,dropoff_service_minutes,\
+                                 assignment_sol,order_sol,courier_sol,stage=None):
+    # same as check_feasibility_rowwise (compute_performance_summary.py)
+    solution=solution_arrays_from_frames(assignment_sol,order_sol,courier_sol)
+    if stage:
+        stage('solution_arrays',len(assignment_sol))
+    return check_feasibility_arrays(orders,couriers,locations,meters_per_minute,\
+                                    pickup_service_minutes,dropoff_service_minutes,solution,stage)
+
+def check_feasibility_arrays(orders,couriers,locations,meters_per_minute,\
+                             pickup_service_minutes,dropoff_service_minutes,solution,stage=None):
+    # locations: the locations frame of read_instance_information, or a LocationIndex
+    # solution: a SolutionArrays
+    # stage: optional callback, called with the key of each check and the number of rows it
+    # checked once it is done (see stage_timer.py)
+    stage=stage or (lambda name,rows=None:None)
+    checks={}
+    ids=solution.ids
+    n_ids=len(ids)
+    places=np.append(ids,'') # place code -1: in transit
+    n_assignments=len(solution.assignment_time)
+    bundle_size=np.diff(solution.bundle_offsets)
+    bundle_start=solution.bundle_offsets[:-1]
+    stop_assignment=np.repeat(np.arange(n_assignments),bundle_size)
+    stop_position=np.arange(len(stop_assignment))-bundle_start[stop_assignment]
+    stop_order=solution.bundle_orders
+    pickup_time=solution.pickup_time
+
+    # verify that each order is in at most one assignment
+    # (an order reported more than once in the order solution file counts once per line)
+    assigned=np.unique(stop_assignment.astype(np.int64)*n_ids+stop_order)%n_ids
+    times_assigned=np.bincount(assigned,minlength=n_ids)
+    times_reported=np.bincount(solution.order,minlength=n_ids)
+    _,first_report=np.unique(solution.order,return_index=True)
+    reported=solution.order[np.sort(first_report)]
+    checks['orders_in_several_assignments']=ids[reported[times_assigned[reported]*times_reported[reported]>1]].tolist()
+    stage('orders_in_several_assignments',len(solution.order))
+
+    # verify that assignments are not made before information is revealed
+    stop_order_position=code_positions(orders.index,ids,stop_order)
+    placement=orders.placement_time.to_numpy()[stop_order_position]
+    early=solution.assignment_time[stop_assignment]<placement
+    checks['assignments_before_placement']=[(int(solution.assignment_time[stop_assignment[k]]),placement[k],\
+                                             ids[stop_order[k]],solution.assignment_row(stop_assignment[k]))\
+                                            for k in np.flatnonzero(early)]
+    stage('assignments_before_placement',len(stop_order))
+
+    # verify that each assignment is picked up before the off-time of the courier
+    courier_position=code_positions(couriers.index,ids,solution.assignment_courier)
+    offtime=couriers.off_time.to_numpy()[courier_position]
+    late=offtime<pickup_time
+    checks['pickups_after_off_time']=[(offtime[i],int(pickup_time[i]),solution.assignment_row(i))\
+                                      for i in np.flatnonzero(late)]
+    stage('pickups_after_off_time',n_assignments)
+
+    # verify that, for each assignment, the pickup time is not earlier than the ready time of any order in the bundle
+    ready=orders.ready_time.to_numpy()[stop_order_position]
+    premature=ready>pickup_time[stop_assignment]
+    checks['pickups_before_ready_time']=[(int(pickup_time[stop_assignment[k]]),ready[k],\
+                                          solution.assignment_row(stop_assignment[k]))\
+                                         for k in np.flatnonzero(premature)]
+    stage('pickups_before_ready_time',len(stop_order))
+
+    # verify that dropoffs follow the sequence of each bundle, separated at least by the
+    # dropoff service time
+    order_row=np.full(n_ids,-1,dtype=np.int64)
+    order_row[solution.order]=np.arange(len(solution.order))
+    stop_order_row=order_row[stop_order]
+    if (stop_order_row<0).any():
+        raise KeyError(ids[stop_order[stop_order_row<0][0]])
+    dropoff=solution.order_dropoff_time[stop_order_row]
+    previous_dropoff=np.roll(dropoff,1)
+    out_of_sequence=(stop_position>0)&(dropoff<previous_dropoff+dropoff_service_minutes)
+    bundle_dropoffs=lambda a:list(dropoff[bundle_start[a]:bundle_start[a]+bundle_size[a]])
+    checks['dropoffs_out_of_sequence']=[(bundle_dropoffs(stop_assignment[k]),dropoff[k],solution.bundle(stop_assignment[k]))\
+                                        for k in np.flatnonzero(out_of_sequence)]
+    stage('dropoffs_out_of_sequence',len(stop_order))
+
+    # courier timelines: [on time, departure, arrival, departure, arrival, ...] and the
+    # places where the courier stays from each of those times on (none while in transit).
+    # Verify that couriers do not tele-transport (each origin is the previous destination)
+    # and that departures do not happen before arrivals (timelines are sorted)
+    moves_per_courier=np.diff(solution.move_offsets)
+    first_move=solution.move_offsets[:-1]
+    move_courier=np.repeat(np.arange(len(solution.couriers)),moves_per_courier)
+    origins=solution.origin
+    destinations=solution.destination
+    departures=solution.departure_time.astype(np.float64)
+    if not isinstance(locations,LocationIndex):
+        locations=LocationIndex.from_locations(locations)
+    travel_time=locations.travel_times(code_positions(locations.ids,ids,origins),\
+                                       code_positions(locations.ids,ids,destinations),meters_per_minute)
+    arrivals=departures+travel_time
+
+    has_moves=moves_per_courier>0
+    previous_place=np.roll(destinations,1)
+    previous_place[first_move[has_moves]]=solution.couriers[has_moves]
+    discontinuous=origins!=previous_place
+    checks['discontinuous_moves']=[(ids[solution.couriers[move_courier[m]]],ids[origins[m]],ids[previous_place[m]])\
+                                   for m in np.flatnonzero(discontinuous)]
+    stage('discontinuous_moves',len(origins))
+
+    on_time=couriers.on_time.to_numpy()[code_positions(couriers.index,ids,solution.couriers)]
+    timelines=CourierTimelines.from_moves(solution.couriers,on_time,solution.move_offsets,\
+                                          departures,arrivals,destinations,n_ids)
+    violations=[]
+    for c in np.flatnonzero(~timelines.is_sorted):
+        times=[couriers.loc[ids[solution.couriers[c]]].on_time]
+        for m in range(first_move[c],first_move[c]+moves_per_courier[c]):
+            times+=[int(solution.departure_time[m]),arrivals[m]]
+        violations.append(times)
+    checks['departures_before_arrivals']=violations
+    stage('departures_before_arrivals',len(solution.couriers))
+
+    time_driving=dict(zip(ids[solution.couriers].tolist(),\
+                          np.bincount(move_courier,weights=travel_time,minlength=len(solution.couriers)).tolist()))
+
+    # Verify that for each dropoff, the courier is located at the right place at the right time
+    courier_of_id=couriers.index.get_indexer(ids)
+    order_courier=solution.order_courier
+    served=np.flatnonzero(order_courier>=0)
+    served=served[courier_of_id[order_courier[served]]>=0]
+    dropoff_places=locate_couriers(timelines,ids,order_courier[served],solution.order_dropoff_time[served])
+    served_orders=solution.order[served]
+    checks['dropoff_location_mismatches']=[(ids[served_orders[k]],solution.order_dropoff_time[served[k]].item(),\
+                                            places[dropoff_places[k]])\
+                                           for k in np.flatnonzero(dropoff_places!=served_orders)]
+    stage('dropoff_location_mismatches',len(served))
+    orders_per_courier=np.bincount(courier_of_id[order_courier[served]],minlength=len(couriers))
+    orders_served=dict(zip(couriers.index,orders_per_courier.tolist()))
+    time_dropping=dict(zip(couriers.index,(orders_per_courier*dropoff_service_minutes).tolist()))
+
+    # Verify that, for each pickup, the courier is located at the right place at the right time
+    if (bundle_size==0).any():
+        raise ValueError('assignment with an empty bundle: there is no order to pick up')
+    first_order=stop_order[bundle_start]
+    restaurant=orders.restaurant.to_numpy(dtype=object)[stop_order_position[bundle_start]]
+    pickup_places=locate_couriers(timelines,ids,solution.assignment_courier,pickup_time)
+    mismatch=pickup_places!=solution.codes(restaurant)
+    checks['pickup_location_mismatches']=[(ids[first_order[i]],restaurant[i],int(pickup_time[i]),places[pickup_places[i]])\
+                                          for i in np.flatnonzero(mismatch)]
+    stage('pickup_location_mismatches',n_assignments)
+    bundles_per_assignment_courier=np.bincount(courier_position,minlength=len(couriers))
+    bundles_per_courier=dict(zip(couriers.index,bundles_per_assignment_courier.tolist()))
+    time_picking=dict(zip(couriers.index,(bundles_per_assignment_courier*pickup_service_minutes).tolist()))
+
+    orders_per_bundle=bundle_size.tolist()
+    tallies={'orders_per_bundle':orders_per_bundle,'bundles_per_courier':bundles_per_courier,\
+             'orders_served':orders_served,'time_driving':time_driving,\
+             'time_dropping':time_dropping,'time_picking':time_picking}
+    return checks,tallies